@@ -0,0 +1,27 @@
+# This file bakes the .aseprite sources of the assets into texture atlases (one group per folder).
+# Usage: python src/bake.py [--force] [folders...]
+import sys
+import os
+import pygame
+from utils.consoleSystem import console
+from utils.atlasHandler import atlas
+
+if __name__ == "__main__":
+    pygame.init()
+    force = "--force" in sys.argv
+    folders = [arg for arg in sys.argv[1:] if arg != "--force"]
+
+    # Every folder of the assets with .aseprite files is a group
+    if len(folders) == 0:
+        for root, dirs, files in os.walk("assets"):
+            if root.startswith(atlas.atlas_folder_path.rstrip("/")):
+                continue
+            if any(f.endswith(".aseprite") for f in files):
+                folders.append(root)
+
+    for folder in folders:
+        atlas.bake_group(folder, force=force)
+
+    atlas.quit()
+    console.quit()
+    pygame.quit()
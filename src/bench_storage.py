@@ -0,0 +1,151 @@
+# This file benchmarks the storage handler on generated storage folders (the real assets/storage is never touched).
+# Every public function is timed cold (first call on a new handler) and warm (repeated calls), the results are printed
+# and can be saved as json to compare commits.
+# Usage: python src/bench_storage.py [--files N] [--keys N] [--shortcuts N] [--type .json|.jsonl] [--samples N] [--cold N] [--output path]
+import argparse
+import json
+import os
+import tempfile
+from time import perf_counter_ns
+from utils.consoleSystem import console
+from utils.timeToolbox import get_statistics
+from utils.storageHandler import storageHandler
+
+def make_storage(folder:str, files:int, keys:int, shortcuts:int, type:str):
+    """
+    Fill a folder with generated files and shortcuts.
+
+    Args:
+        folder (str): path of the folder (with a final "/").
+        files (int): number of data files.
+        keys (int): number of keys in each file.
+        shortcuts (int): number of shortcuts (the ones after the files are aliases of them).
+        type (str): extension of the data files (".json" or ".jsonl").
+    """
+    for k in range(files):
+        content = {"key_"+str(k)+"_"+str(n): {"value": n, "name": "entry "+str(n)} for n in range(keys)}
+        with open(folder+"file_"+str(k)+type, "w") as file:
+            if type == ".jsonl":
+                file.writelines(json.dumps([key, value])+"\n" for key, value in content.items())
+            else:
+                json.dump(content, file, indent=4)
+    short = {"default": "file_0"+type, "shortcuts": "shortcuts.json"}
+    for k in range(shortcuts):
+        short["short_"+str(k)] = "file_"+str(k % files)+type
+    with open(folder+"shortcuts.json", "w") as file:
+        json.dump(short, file, indent=4)
+
+def summarize(times:list):
+    """
+    Get the statistics of a list of times in ns, in µs.
+    """
+    statistics = get_statistics(times)
+    return {key: value if key == "count" else value / 1000 for key, value in statistics.items()}
+
+def get_cases(files:int, keys:int, type:str):
+    """
+    Get the benchmarked operations: name -> (setup, call). The setup prepares the handler before each call and isn't timed.
+    """
+    last = "file_"+str(files - 1)+type
+    last_key = "key_"+str(files - 1)+"_"+str(keys - 1)
+    first_key = "key_0_0"
+
+    def set_bench(handler):
+        handler.parameter_set("bench", 0, "file_0"+type)
+
+    def create_bench(handler):
+        handler.file_create("bench.json", content={"bench": 0}, short="bench")
+
+    def create_renamable(handler):
+        if os.path.exists(handler.storage_folder_path+"renamed.json"):
+            handler.file_delete("renamed.json")
+        create_bench(handler)
+
+    def add_shortcut(handler):
+        if "bench" not in handler.shortcuts:
+            handler.set_shortcut("bench.json", None, "bench")
+
+    def remove_shortcut(handler):
+        if "bench" in handler.shortcuts:
+            handler.set_shortcut(None, "bench.json")
+
+    return {
+        "get_address_of": (None, lambda handler: handler.get_address_of("short_"+str(files - 1))),
+        "file_read": (None, lambda handler: handler.file_read(last)),
+        "file_write": (None, lambda handler: handler.file_write("bench.txt", "bench")),
+        "file_create": (None, create_bench),
+        "file_delete": (create_bench, lambda handler: handler.file_delete("bench.json")),
+        "file_rename": (create_renamable, lambda handler: handler.file_rename("bench.json", "renamed", "renamed")),
+        "param_get": (None, lambda handler: handler.parameter_get(first_key, "file_0"+type)),
+        "param_get_search": (None, lambda handler: handler.parameter_get(last_key)),
+        "param_getlist": (None, lambda handler: list(handler.parameter_getlist([first_key, last_key], ["file_0"+type, last]))),
+        "param_set": (None, set_bench),
+        "param_del": (set_bench, lambda handler: handler.parameter_delete("bench", "file_0"+type)),
+        "param_reset": (None, lambda handler: handler.parameter_reset("bench.txt", "bench")),
+        "set_shortcut_add": (remove_shortcut, add_shortcut),
+        "set_shortcut_delete": (add_shortcut, remove_shortcut),
+    }
+
+def run(files:int, keys:int, shortcuts:int, type:str, samples:int, cold:int):
+    """
+    Run the benchmark in a temporary storage folder and return the results.
+    """
+    results = {"config": {"files": files, "keys": keys, "shortcuts": shortcuts, "type": type, "samples": samples, "cold": cold},
+               "cold": {}, "warm": {}}
+    with tempfile.TemporaryDirectory(prefix="bench_storage_") as folder:
+        folder = folder+"/"
+        make_storage(folder, files, keys, shortcuts, type)
+        cases = get_cases(files, keys, type)
+        for name, (setup, call) in cases.items():
+            # Cold: the first call on a new handler (no opened documents)
+            times = []
+            for k in range(cold):
+                handler = storageHandler(folder)
+                if setup is not None:
+                    setup(handler)
+                handler.documents.clear()
+                start = perf_counter_ns()
+                call(handler)
+                times.append(perf_counter_ns() - start)
+            results["cold"][name] = summarize(times)
+
+            # Warm: repeated calls on the same handler
+            handler = storageHandler(folder)
+            if setup is not None:
+                setup(handler)
+            call(handler)
+            times = []
+            for k in range(samples):
+                if setup is not None:
+                    setup(handler)
+                start = perf_counter_ns()
+                call(handler)
+                times.append(perf_counter_ns() - start)
+            results["warm"][name] = summarize(times)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the storage handler on a generated storage folder.")
+    parser.add_argument("--files", type=int, default=20, help="number of data files")
+    parser.add_argument("--keys", type=int, default=100, help="number of keys in each file")
+    parser.add_argument("--shortcuts", type=int, default=50, help="number of shortcuts")
+    parser.add_argument("--type", default=".json", choices=(".json", ".jsonl"), help="extension of the data files")
+    parser.add_argument("--samples", type=int, default=200, help="number of warm calls of each function")
+    parser.add_argument("--cold", type=int, default=10, help="number of cold calls of each function")
+    parser.add_argument("--output", default=None, help="json file where the results are saved")
+    args = parser.parse_args()
+
+    # Only the problems are shown while the handlers are created and used
+    for level in ("info", "debug", "trace"):
+        console.live_active[level] = False
+        console.log_active[level] = False
+
+    results = run(max(1, args.files), max(1, args.keys), max(0, args.shortcuts), args.type, max(1, args.samples), max(1, args.cold))
+    print(format("function", "<20")+format("cold p50", ">12")+format("warm p50", ">12")+format("warm p90", ">12")+format("warm p99", ">12")+"  (µs)")
+    for name in results["warm"]:
+        cold, warm = results["cold"][name], results["warm"][name]
+        print(format(name, "<20")+format(cold["p50"], ">12.1f")+format(warm["p50"], ">12.1f")+format(warm["p90"], ">12.1f")+format(warm["p99"], ">12.1f"))
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=4)
+        print("Results saved in '"+args.output+"'.")
\ No newline at end of file
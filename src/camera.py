@@ -0,0 +1,89 @@
+# The camera decides where the view is centered.
+# It follows a target with a dead-zone, an optional critically damped smoothing and a pixel snapping,
+# so the map renderer only moves (and redraws its buffer edges) when it really has to.
+from math import exp
+from utils.timeToolbox import Timer
+
+class Camera:
+
+    def __init__(self, dead_zone=(0, 0), smoothing:float = 0, pixel_snap:bool = True):
+        """
+        dead_zone: size (w, h) of the zone around the view center where the target can move freely.
+        smoothing: time in ms the camera takes to catch up with the target (0 means no smoothing).
+        pixel_snap: move the view only by whole pixels.
+        """
+        self.dead_zone = dead_zone
+        self.smoothing = smoothing
+        self.pixel_snap = pixel_snap
+        self.position = None
+        self.focus = None
+        self.velocity = [0.0, 0.0]
+        self.view = None
+
+        # Counters of the current second and of the last full second
+        self.timer = Timer(1000)
+        self.counters = {"view_changes": 0, "tile_redraws": 0}
+        self.stats = {"view_changes": 0, "tile_redraws": 0}
+
+    def reset(self, target):
+        """
+        Put the camera directly on the target (used when the map changes).
+        """
+        self.focus = [float(target[0]), float(target[1])]
+        self.position = list(self.focus)
+        self.velocity = [0.0, 0.0]
+        self.view = None
+
+    def follow(self, target, dt:float):
+        """
+        Move the camera toward the target and return the view center. dt is the frame time in ms.
+        """
+        if self.position is None:
+            self.reset(target)
+
+        # The focus only moves when the target leaves the dead-zone
+        for axis in (0, 1):
+            half = self.dead_zone[axis] / 2
+            if target[axis] > self.focus[axis] + half:
+                self.focus[axis] = target[axis] - half
+            elif target[axis] < self.focus[axis] - half:
+                self.focus[axis] = target[axis] + half
+
+        # Critically damped spring toward the focus
+        if self.smoothing > 0 and dt > 0:
+            omega = 2000 / self.smoothing
+            decay = exp(-omega * dt / 1000)
+            for axis in (0, 1):
+                change = self.position[axis] - self.focus[axis]
+                temp = (self.velocity[axis] + omega * change) * dt / 1000
+                self.velocity[axis] = (self.velocity[axis] - omega * temp) * decay
+                self.position[axis] = self.focus[axis] + (change + temp) * decay
+        else:
+            self.position = list(self.focus)
+
+        if self.pixel_snap:
+            return (round(self.position[0]), round(self.position[1]))
+        return tuple(self.position)
+
+    def center(self, group, map_layer, target, dt:float):
+        """
+        Center the group on the target if the view changed, and count the renderer work.
+        """
+        view = self.follow(target, dt)
+        if view != self.view:
+            redraws = map_layer.tile_redraws
+            group.center(view)
+            self.view = view
+            self.counters["view_changes"] += 1
+            self.counters["tile_redraws"] += map_layer.tile_redraws - redraws
+
+        if self.timer.check():
+            self.stats = dict(self.counters)
+            self.counters = {"view_changes": 0, "tile_redraws": 0}
+            self.timer.reset(1000)
+
+    def get_stats(self):
+        """
+        Get the number of view changes and tile redraws of the last second.
+        """
+        return self.stats
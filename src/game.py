@@ -1,9 +1,20 @@
 # This game file is not the game logic, it's the handling of the game and the rendering part.
 import pygame, pytmx, pyscroll
+import threading
+from time import perf_counter
+from math import ceil
 from utils.storageHandler import param_get
 from utils.sceneHandler import scene
+from utils.telemetryHandler import publish
+from utils.timeToolbox import FramePacer
+from utils.consoleSystem import warn, info
 
 from player import *
+from pipeline import GameSnapshot
+from camera import Camera
+from hud import Hud
+from lighting import Lighting
+from sprite_layer import SpriteLayer
 
 class Game:
 
@@ -11,32 +22,280 @@ class Game:
         """
         This is the game init function. It's called at the beginning of the game.
         """
-        self.clock = pygame.time.Clock()
-
         # Get variables
         self.window_name = param_get("window_name")
 
         # Renderer part
-        self.screen = pygame.display.set_mode(param_get("screen_size"))
+        self.vsync = param_get("vsync")
+        self.upscale = param_get("upscale")
+        self.internal_resolution = param_get("internal_resolution")
+        self.screen = self.create_screen(param_get("screen_size"))
         pygame.display.set_caption(self.window_name)
+        self.canvas = self.create_canvas(self.internal_resolution)
+
+        # Frame pacing (the display paces the frames itself when vsync is on)
+        self.pacer = FramePacer(param_get("fps"), param_get("fps_mode"), param_get("idle_fps"))
+        if self.vsync:
+            self.pacer.set_mode("uncapped")
+        self.max_dt = 50 / (param_get("fps") or 60) # Longest time step of a tick
+        self.max_steps = 4 # Most ticks run for one frame, past it (idle frame rate, long hitch) the game slows down
 
         # TODO: Make it configurable with saved files.
         self.player = Player()
         self.player.position = (755, 670)
-        
+        self.player_view = pygame.sprite.Sprite()
+        self.player_view.image = self.player.image
+        self.player_view.rect = self.player.rect.copy()
+        self.player_view.dynamic = True
+
+        # The scene lock is shared by the simulation (map changes) and the renderer (map groups)
+        self.scene_lock = threading.RLock()
+        camera = param_get("camera")
+        self.camera = Camera(camera["dead_zone"], camera["smoothing"], camera["pixel_snap"])
+        self.tick = 0
+        self.group_key = None
+        self.groups = {}
+        self.group_cache = {"hits": 0, "misses": 0}
+        self.prewarm_queue = []
+        self.hud = Hud(param_get("hud"))
+        lighting = param_get("lighting")
+        self.lighting = Lighting(lighting["enabled"], lighting["scale"], lighting["ambient"])
+        self.player_light = {"position": (0, 0), "radius": lighting["player_light"], "color": (255, 255, 255)}
+        self.load_budget = param_get("load_budget") # Time in ms given to the load of a scene each tick
+        self.loading = None # (sceneLoader, portal) while the player waits for a scene to load
+        self.phase_times = {"update": 0, "map": 0, "camera": 0, "draw": 0, "light": 0, "upscale": 0, "flip": 0}
         self.update_map("testa", "scene1")
 
+    def create_screen(self, screen_size):
+        """
+        Create the window, with vsync if it's asked and the display supports it.
+        With the "display" upscale, the window surface is the internal resolution and the display scales it.
+        """
+        flags = 0
+        if self.upscale == "display" and self.internal_resolution is not None:
+            screen_size, flags = self.internal_resolution, pygame.SCALED
+        if self.vsync:
+            try:
+                screen = pygame.display.set_mode(screen_size, pygame.SCALED, vsync=1)
+                info("Vsync enabled.")
+                return screen
+            except pygame.error:
+                warn("Vsync is not supported by the display. Fallback to the frame pacer.")
+                self.vsync = False
+        return pygame.display.set_mode(screen_size, flags)
+
+    def create_canvas(self, internal_resolution):
+        """
+        Create the surface where the map and the sprites are drawn. With an internal resolution, it's a small canvas
+        upscaled once per frame on the screen (keeping its ratio), else it's the screen itself.
+        """
+        if internal_resolution is None or self.upscale == "display":
+            self.canvas_view = None
+            return self.screen
+        canvas = pygame.Surface(internal_resolution).convert()
+        screen_size = self.screen.get_size()
+        factor = min(screen_size[0] / internal_resolution[0], screen_size[1] / internal_resolution[1])
+        if self.upscale == "integer" and factor >= 1:
+            factor = int(factor)
+        rect = pygame.Rect(0, 0, round(internal_resolution[0] * factor), round(internal_resolution[1] * factor))
+        rect.center = self.screen.get_rect().center
+        self.screen.fill((0, 0, 0))
+        self.canvas_view = self.screen.subsurface(rect)
+        info("Internal resolution "+str(internal_resolution[0])+"x"+str(internal_resolution[1])+", upscaled x"+format(factor, ".2f")+" ("+self.upscale+").")
+        return canvas
+
+    def present(self):
+        """
+        Upscale the canvas on the screen (nothing to do without internal resolution).
+        """
+        if self.canvas_view is None:
+            return
+        if self.upscale == "smooth":
+            pygame.transform.smoothscale(self.canvas, self.canvas_view.get_size(), self.canvas_view)
+        else:
+            pygame.transform.scale(self.canvas, self.canvas_view.get_size(), self.canvas_view)
+
+    def draw_loading(self, progress:float):
+        """
+        Draw the progress bar of a scene load at the bottom of the screen (the current map stays drawn behind it).
+        """
+        width, height = self.screen.get_size()
+        bar = pygame.Rect(width // 8, height - height // 12, width * 3 // 4, max(4, height // 60))
+        self.screen.fill((0, 0, 0), bar.inflate(4, 4))
+        self.screen.fill((255, 255, 255), (bar.x, bar.y, round(bar.width * progress), bar.height))
+
+    def is_active(self):
+        """
+        Check if the window is shown and has the focus.
+        """
+        return pygame.display.get_active() and pygame.key.get_focused()
+
     def update_map(self, map_name=None, scene_name=None):
-        if scene_name is None:
-            scene_name = self.selected_scene
-        if map_name is None:
-            map_name = self.selected_map
+        """
+        Change the map and rebuild the map group.
+        """
+        self.change_map(map_name, scene_name)
+        self.update_group(scene.selected_map, scene.selected_scene)
 
-        scene.change_map(map_name, scene_name)
-        scene.scene_cleanup()
+    def change_map(self, map_name=None, scene_name=None):
+        """
+        Change the simulated map (without touching the renderer).
+        """
+        with self.scene_lock:
+            scene.change_map(map_name, scene_name)
+            scene.scene_cleanup()
+            # The walls of a streamed map are only known around its loaded chunks, load the ones of the player now
+            scene.stream_map(self.player.position)
+
+    def update_group(self, map_name, scene_name):
+        """
+        Get the map group used to draw the given map, build it only on the first visit.
+        """
+        with self.scene_lock:
+            # Forget the groups (and the baked lights) of the unloaded scenes
+            for key in list(self.groups):
+                if key[0] not in scene.loaded_scenes():
+                    del self.groups[key]
+            self.lighting.forget(self.groups)
+
+            key = (scene_name, map_name)
+            if key in self.groups:
+                self.group_cache["hits"] += 1
+            else:
+                self.group_cache["misses"] += 1
+                self.groups[key] = SpriteLayer(map_layer=scene.get_map_layer(map_name, scene_name), default_layer=4)
+                self.groups[key].add(self.player_view)
+                map_data = scene.get_map_data(map_name, scene_name)
+                self.lighting.bake(key, scene.get_lights(map_name, scene_name),
+                                   (map_data.map_size[0]*map_data.tile_size[0], map_data.map_size[1]*map_data.tile_size[1]), scene.get_zoom(map_name, scene_name))
+            self.group = self.groups[key]
+            self.map_layer = scene.get_map_layer(map_name, scene_name)
+            self.group_key = key
+            self.camera.position = None
 
-        self.group = pyscroll.PyscrollGroup(map_layer=scene.get_map_layer(map_name, scene_name), default_layer=4)
-        self.group.add(self.player)
+            # The maps reachable from this one will be warmed around their exits
+            self.prewarm_queue = list(scene.get_portals(map_name, scene_name).values())
+
+    def prewarm(self):
+        """
+        Center the buffer of one map reachable by a portal on its exit, so the switch doesn't redraw it.
+        """
+        if len(self.prewarm_queue) == 0:
+            return
+        portal = self.prewarm_queue.pop()
+        with self.scene_lock:
+            key = (portal["targeted_scene_name"], portal["targeted_map_name"])
+            if key == self.group_key or scene.has_scene_load(key[0]) == 0:
+                return
+            portal_exit = scene.get_portal_exit(portal)
+            scene.get_map_layer(key[1], key[0]).center((portal_exit.x, portal_exit.y))
+
+    def step(self, dt):
+        """
+        Run one simulation tick: player movement and portals.
+        """
+        start = perf_counter()
+        if self.loading is not None:
+            # The player waits at the portal while the targeted scene loads (on the render thread)
+            if self.loading[0].done:
+                self.end_loading()
+        else:
+            self.player.update(dt)
+
+            # Teleport the player if he collide with a portal
+            for portal in scene.get_portals().values():
+                if self.player.feet.colliderect(portal["rect"]) == True:
+                    self.take_portal(portal)
+                    break
+        self.tick += 1
+        self.phase_times["update"] = (perf_counter() - start) * 1000
+
+    def take_portal(self, portal):
+        """
+        Teleport the player to the exit of a portal. If the targeted scene isn't loaded, its load is asked to the renderer,
+        which runs it over the next frames (a slice of the load budget each frame), and the player is teleported when it's done.
+        """
+        if scene.has_scene_load(portal["targeted_scene_name"]) == 0:
+            with self.scene_lock:
+                self.loading = (scene.start_loading(portal["targeted_scene_name"]), portal)
+            return
+        portal_exit = scene.get_portal_exit(portal)
+        self.player.position = (portal_exit.x, portal_exit.y)
+        self.change_map(portal["targeted_map_name"], portal["targeted_scene_name"])
+
+    def advance_loading(self):
+        """
+        Advance the asked scene load for the load budget. It creates and converts surfaces, so it's only run by the renderer.
+        """
+        loading = self.loading
+        if loading is None or loading[0].done:
+            return
+        with self.scene_lock:
+            loading[0].advance(self.load_budget)
+
+    def end_loading(self):
+        """
+        Take the portal the player waits at, once its scene is loaded.
+        """
+        loader, portal = self.loading
+        self.loading = None
+        if loader.result:
+            self.take_portal(portal)
+        else:
+            warn("Scene '"+portal["targeted_scene_name"]+"' can't be loaded, the portal is ignored.")
+
+    def snapshot(self):
+        """
+        Get an immutable snapshot of the simulated state for the renderer.
+        """
+        return GameSnapshot(self.tick, tuple(self.player.position), self.player.rect.center,
+                            scene.selected_scene, scene.selected_map,
+                            self.loading[0].progress() if self.loading is not None else None)
+
+    def render(self, snapshot):
+        """
+        Draw a snapshot of the game.
+        """
+        start = perf_counter()
+        self.advance_loading()
+        with self.scene_lock:
+            # In pipelined mode the snapshot can be older than a map change, its scene may be unloaded already
+            if (snapshot.scene_name, snapshot.map_name) != self.group_key and scene.has_scene_load(snapshot.scene_name) != 0:
+                self.update_group(snapshot.map_name, snapshot.scene_name)
+            else:
+                self.prewarm()
+        phase = perf_counter()
+        self.phase_times["map"] = (phase - start) * 1000
+
+        # Recenter, stream the chunks around the view (for the big maps) and draw
+        self.player_view.rect.center = snapshot.player_center
+        self.camera.center(self.group, self.map_layer, snapshot.player_center, self.pacer.get_frame_time())
+        with self.scene_lock:
+            if scene.has_scene_load(self.group_key[0]) != 0:
+                scene.stream_map(self.map_layer.view_rect.center, self.group_key[1], self.group_key[0])
+        start, phase = phase, perf_counter()
+        self.phase_times["camera"] = (phase - start) * 1000
+        self.group.draw(self.canvas)
+        start, phase = phase, perf_counter()
+        self.phase_times["draw"] = (phase - start) * 1000
+        lights = ()
+        if self.player_light["radius"] > 0:
+            self.player_light["position"] = snapshot.player_center
+            lights = (self.player_light,)
+        self.lighting.draw(self.canvas, self.group_key, self.map_layer.view_rect, self.map_layer.zoom, lights)
+        start, phase = phase, perf_counter()
+        self.phase_times["light"] = (phase - start) * 1000
+        self.present()
+        start, phase = phase, perf_counter()
+        self.phase_times["upscale"] = (phase - start) * 1000
+        if snapshot.loading is not None:
+            self.draw_loading(snapshot.loading)
+        self.hud.record(self.pacer.get_frame_time())
+        self.hud.draw(self.screen, self)
+        pygame.display.flip()
+        self.phase_times["flip"] = (perf_counter() - phase) * 1000
+        publish(snapshot.tick, self.pacer.get_frame_time(), self.pacer.get_fps(), self.phase_times,
+                snapshot.player_position, snapshot.scene_name, snapshot.map_name)
 
     def run(self):
         """
@@ -44,23 +303,18 @@ class Game:
         """
 
         # Update the player movement. TODO: Dispatch it to the player class
-        self.clock.tick(60)
+        self.pacer.tick(not self.is_active())
         try:
-            dt = 50 / self.clock.get_fps()
+            dt = 50 / self.pacer.get_fps()
         except:
             dt = 0
-        self.player.update(dt)
-
-        # Teleport the player if he collide with a portal
-        for portal in scene.get_portals():
-            if self.player.feet.colliderect(scene.get_portals()[portal]["rect"]) == True:
-                self.player.position = (scene.get_portal_exit(scene.get_portals()[portal]).x, scene.get_portal_exit(scene.get_portals()[portal]).y)
-                self.update_map(scene.get_portals()[portal]["targeted_map_name"], scene.get_portals()[portal]["targeted_scene_name"])
-
-        # Recenter and draw
-        self.group.center(self.player.rect.center)
-        self.group.draw(self.screen)
-        pygame.display.flip()
+        # The collisions are tested for one step of velocity, so a slow frame is split in ticks no longer than the
+        # step of the nominal frame rate (a longer one would go through the walls)
+        steps = max(1, min(ceil(dt / self.max_dt), self.max_steps))
+        dt = min(dt, self.max_dt * steps)
+        for k in range(steps):
+            self.step(dt / steps)
+        self.render(self.snapshot())
 
     def quit(self):
         """
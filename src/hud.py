@@ -0,0 +1,99 @@
+# The HUD is a toggleable performance overlay drawn over the game.
+# The text and the sparkline are rendered only a few times per second and the cached surfaces are blitted every frame,
+# so the overlay doesn't distort what it measures.
+import pygame
+from collections import deque
+from utils.timeToolbox import Timer
+from utils.storageHandler import storage
+from utils.sceneHandler import scene
+
+class Hud:
+
+    def __init__(self, visible:bool = False, refresh:int = 250):
+        """
+        visible: show the overlay at the start.
+        refresh: time in ms between two updates of the text and the sparkline.
+        """
+        self.visible = visible
+        self.refresh = refresh
+        self.timer = Timer(refresh)
+        self.font = pygame.font.Font(None, 18)
+        self.frame_times = deque(maxlen=120)
+        self.labels = {} # Glyph cache: text -> surface
+        self.lines = []
+        self.sparkline = pygame.Surface((120, 30), pygame.SRCALPHA)
+        self.background = None
+
+    def toggle(self):
+        """
+        Show or hide the overlay.
+        """
+        self.visible = not self.visible
+        self.timer.reset(0)
+
+    def record(self, frame_time:float):
+        """
+        Save the frame time (ms) for the sparkline. It's cheap, so it's done even when the overlay is hidden.
+        """
+        self.frame_times.append(frame_time)
+
+    def get_label(self, text:str):
+        """
+        Get the rendered surface of a text, from the cache if it was already rendered.
+        """
+        if text not in self.labels:
+            if len(self.labels) > 256:
+                self.labels.clear()
+            self.labels[text] = self.font.render(text, True, (255, 255, 255))
+        return self.labels[text]
+
+    def update(self, game):
+        """
+        Rebuild the lines of the overlay and the sparkline.
+        """
+        phases = "  ".join(name+" "+format(time, ".2f") for name, time in game.phase_times.items())
+        maps = ", ".join(name+"("+str(scene.has_scene_load(name))+")" for name in scene.loaded_scenes())
+        camera = game.camera.get_stats()
+        texts = [
+            "FPS "+format(game.pacer.get_fps(), ".1f")+"  frame "+format(game.pacer.get_frame_time(), ".2f")+"ms",
+            phases,
+            "walls tested "+str(game.player.walls_tested)+"  sprites drawn "+str(game.group.drawn)+"/"+str(len(game.group)),
+            "scenes "+maps+"  map "+str(game.group_key[1]),
+            "groups "+str(game.group_cache["hits"])+" hits / "+str(game.group_cache["misses"])+" misses",
+            "scene loads "+str(scene.stats["loads"])+"  storage reads "+str(storage.stats["reads"])+" writes "+str(storage.stats["writes"]),
+            "view changes "+str(camera["view_changes"])+"/s  tile redraws "+str(camera["tile_redraws"])+"/s"]
+        self.lines = [self.get_label(text) for text in texts]
+
+        # Sparkline of the frame times (the top is twice the target frame time)
+        self.sparkline.fill((0, 0, 0, 0))
+        w, h = self.sparkline.get_size()
+        top = 2000 / game.pacer.fps if game.pacer.fps else max(self.frame_times, default=1)
+        points = [(k, h - 1 - min(time / top, 1) * (h - 1)) for k, time in enumerate(self.frame_times)]
+        if len(points) > 1:
+            pygame.draw.lines(self.sparkline, (0, 255, 0), False, points)
+        pygame.draw.line(self.sparkline, (255, 255, 0), (0, h // 2), (w, h // 2))
+
+        width = max([line.get_width() for line in self.lines] + [w]) + 8
+        height = sum(line.get_height() for line in self.lines) + h + 8
+        if self.background is None or self.background.get_size() != (width, height):
+            self.background = pygame.Surface((width, height), pygame.SRCALPHA)
+            self.background.fill((0, 0, 0, 160))
+
+    def draw(self, surface, game):
+        """
+        Draw the overlay on the surface.
+        """
+        if not self.visible:
+            return
+        # The first frame is drawn before the timer has fired once
+        if self.background is None or self.timer.check():
+            self.update(game)
+            self.timer.reset(self.refresh)
+
+        blits = [(self.background, (0, 0))]
+        y = 4
+        for line in self.lines:
+            blits.append((line, (4, y)))
+            y += line.get_height()
+        blits.append((self.sparkline, (4, y)))
+        surface.blits(blits, doreturn=False)
@@ -0,0 +1,105 @@
+# The lighting pass darkens the frame and adds the lights over it.
+# The radial gradients are rendered once per radius and colour, the static lights of a map are baked once,
+# and everything is composited in a low resolution light map that is scaled and multiplied over the frame.
+import pygame
+
+class Lighting:
+
+    def __init__(self, enabled:bool = False, scale:int = 4, ambient=(255, 255, 255)):
+        """
+        enabled: draw the lighting pass.
+        scale: the light map is this many times smaller than the screen.
+        ambient: colour of the unlit zones (white means no darkening).
+        """
+        self.enabled = enabled
+        self.scale = max(1, scale)
+        self.ambient = tuple(ambient)
+        self.textures = {} # Gradient cache: (radius, colour) -> surface
+        self.baked = {} # Static light maps: (scene, map) -> (surface, factor, lights)
+        self.max_baked_size = 2048 # Above this size (streamed maps), the static lights are drawn with the dynamic ones
+        self.light_map = None
+        self.scaled = None
+
+    def toggle(self):
+        """
+        Enable or disable the lighting pass.
+        """
+        self.enabled = not self.enabled
+
+    def get_texture(self, radius:int, color):
+        """
+        Get the radial gradient of a light (radius in light map pixels), rendered on the first use.
+        """
+        radius = max(1, int(radius))
+        key = (radius, tuple(color[:3]))
+        if key not in self.textures:
+            texture = pygame.Surface((radius * 2, radius * 2)).convert()
+            texture.fill((0, 0, 0))
+            # Concentric discs from the edge to the center, with a quadratic falloff
+            for r in range(radius, 0, -1):
+                intensity = 1 - (r / radius) ** 2
+                pygame.draw.circle(texture, [int(c * intensity) for c in key[1]], (radius, radius), r)
+            self.textures[key] = texture
+        return self.textures[key]
+
+    def bake(self, key, lights:list, map_size, zoom:float = 1):
+        """
+        Bake the static lights of a map in one light map (done once per map).
+        """
+        factor = zoom / self.scale
+        size = (max(1, int(map_size[0] * factor)), max(1, int(map_size[1] * factor)))
+        if max(size) > self.max_baked_size:
+            self.baked[key] = (None, factor, lights)
+            return
+        baked = pygame.Surface(size).convert()
+        baked.fill((0, 0, 0))
+        self.add_lights(baked, lights, factor, (0, 0))
+        self.baked[key] = (baked, factor, lights)
+
+    def forget(self, keys):
+        """
+        Drop the baked light maps of the maps not in keys.
+        """
+        for key in list(self.baked):
+            if key not in keys:
+                del self.baked[key]
+
+    def add_lights(self, target, lights, factor:float, origin):
+        """
+        Add lights ({"position", "radius", "color"}) to a light map. origin is the world position of its top left.
+        """
+        blits = []
+        for light in lights:
+            texture = self.get_texture(light["radius"] * factor, light["color"])
+            half = texture.get_width() // 2
+            blits.append((texture, ((light["position"][0] - origin[0]) * factor - half,
+                                    (light["position"][1] - origin[1]) * factor - half)))
+        for texture, position in blits:
+            target.blit(texture, position, special_flags=pygame.BLEND_RGB_ADD)
+
+    def draw(self, surface, key, view, zoom:float = 1, lights:list = ()):
+        """
+        Multiply the light map over the frame. view is the world rect shown on the surface, lights are the dynamic lights.
+        """
+        if not self.enabled:
+            return
+        size = surface.get_size()
+        small = (max(1, size[0] // self.scale), max(1, size[1] // self.scale))
+        if self.light_map is None or self.light_map.get_size() != small:
+            # Same pixel format as the frame, so the blends don't convert anything
+            self.light_map = pygame.Surface(small, 0, surface)
+            self.scaled = pygame.Surface(size, 0, surface)
+        factor = zoom / self.scale
+
+        self.light_map.fill(self.ambient)
+        if key in self.baked:
+            baked, baked_factor, static = self.baked[key]
+            if baked is None:
+                lights = [light for light in static if view.inflate(light["radius"] * 2, light["radius"] * 2).collidepoint(light["position"])] + list(lights)
+            elif baked_factor == factor:
+                self.light_map.blit(baked, (0, 0), (int(view.x * factor), int(view.y * factor), small[0], small[1]),
+                                    special_flags=pygame.BLEND_RGB_ADD)
+        self.add_lights(self.light_map, lights, factor, view.topleft)
+
+        pygame.transform.scale(self.light_map, size, self.scaled)
+        surface.blit(self.scaled, (0, 0), special_flags=pygame.BLEND_RGB_MULT)
@@ -1,10 +1,16 @@
 # This main file launch all files, dependencies and loop the bases functions.
 import pygame
 from utils.consoleSystem import console
-from utils.storageHandler import storage
+from utils.storageHandler import storage, param_get
 from utils.sceneHandler import scene
+from utils.atlasHandler import atlas
+from utils.eventHandler import event, subscribe
+from utils.navigationHandler import navigation
+from utils.profilerHandler import profiler
+from utils.telemetryHandler import telemetry
 from game import Game
 from game_logic import Game_logic
+from pipeline import Simulation
 
 if __name__ == "__main__":
     # Initialisation
@@ -12,25 +18,63 @@ if __name__ == "__main__":
     game = Game()
     game_logic = Game_logic()
 
+    # Events registration
+    def stop(e):
+        global running
+        running = False
+    subscribe(pygame.QUIT, stop)
+    subscribe(pygame.KEYDOWN, lambda e: game.hud.toggle(), pygame.key.key_code(param_get("hud_key")))
+    subscribe(pygame.KEYDOWN, lambda e: game.lighting.toggle(), pygame.key.key_code(param_get("lighting")["key"]))
+    subscribe(pygame.KEYDOWN, lambda e: event.set_pause(), pygame.key.key_code(param_get("pause_key")))
+    profiler_context = lambda: str(scene.selected_scene)+"/"+str(scene.selected_map)
+    subscribe(pygame.KEYDOWN, lambda e: profiler.toggle(profiler_context), pygame.key.key_code(param_get("profiler")["key"]))
+    event.start()
+    if param_get("profiler")["enabled"]:
+        profiler.start(profiler_context)
+    if param_get("telemetry")["enabled"]:
+        telemetry.start(param_get("telemetry")["name"])
+
+    # Pipelined mode: the simulation runs on a worker thread and the main thread renders
+    pipelined = param_get("pipelined")
+    if pipelined:
+        simulation = Simulation(game, game_logic, param_get("fps"))
+        simulation.start()
+
     # This is the code run
     running = True
     while running:
 
-        # Quit event registration
-        for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
+        # Events dispatch (it waits for the events when the game is paused)
+        event.dispatch()
 
-        # Game logic part
-        game_logic.run()
+        if pipelined:
+            # Game showing stuff (the latest snapshot of the simulation)
+            game.pacer.tick(not game.is_active())
+            game.render(simulation.buffer.read())
+            if not simulation.is_running():
+                running = False
+        elif event.paused:
+            # Only show the game, the logic is frozen
+            game.pacer.tick(True)
+            game.render(game.snapshot())
+        else:
+            # Game logic part
+            game_logic.run()
 
-        # Game showing stuff
-        game.run()
+            # Game showing stuff
+            game.run()
 
     # Quit (The inverse order of initialization)
+    profiler.quit()
+    telemetry.quit()
+    if pipelined:
+        simulation.stop()
     game_logic.quit()
     game.quit()
     scene.quit()
+    atlas.quit()
+    event.quit()
+    navigation.quit()
     storage.quit()
     console.quit()
     pygame.quit()
\ No newline at end of file
@@ -0,0 +1,95 @@
+# The pipeline runs the simulation on a worker thread while the main thread renders.
+# The simulation publishes immutable snapshots in a double buffer and the renderer draws the latest one.
+import threading
+import traceback
+from typing import NamedTuple
+from utils.timeToolbox import FramePacer
+from utils.consoleSystem import info, error
+from utils.eventHandler import event
+
+class GameSnapshot(NamedTuple):
+    """Immutable state of one simulation tick"""
+    tick: int
+    player_position: tuple
+    player_center: tuple
+    scene_name: str
+    map_name: str
+    loading: float = None # Progress of the scene load the player waits for
+
+class DoubleBuffer:
+
+    def __init__(self, value=None):
+        # Setting up the two slots, the front one is the one read by the renderer
+        self.slots = [value, value]
+        self.front = 0
+        self.lock = threading.Lock()
+
+    def publish(self, value):
+        """
+        Write a value in the back slot and swap it to the front.
+        """
+        back = 1 - self.front
+        self.slots[back] = value
+        with self.lock:
+            self.front = back
+
+    def read(self):
+        """
+        Get the latest published value.
+        """
+        with self.lock:
+            return self.slots[self.front]
+
+class Simulation:
+
+    def __init__(self, game, game_logic, fps:int = 60):
+        """
+        Setting up the simulation worker. The tick rate and dt are fixed so the results are deterministic.
+        """
+        self.game = game
+        self.game_logic = game_logic
+        self.pacer = FramePacer(fps, "hybrid")
+        self.dt = 50 / fps
+        self.buffer = DoubleBuffer(game.snapshot())
+        self.running = threading.Event()
+        self.thread = threading.Thread(target=self.loop, name="simulation", daemon=True)
+
+    def start(self):
+        """
+        Start the simulation thread.
+        """
+        self.running.set()
+        self.thread.start()
+        info("Simulation thread started.")
+
+    def stop(self):
+        """
+        Stop the simulation thread and wait for it.
+        """
+        self.running.clear()
+        if self.thread.is_alive():
+            self.thread.join()
+        info("Simulation thread stopped.")
+
+    def loop(self):
+        """
+        Run the game logic and the game step at a fixed rate and publish the snapshots.
+        """
+        try:
+            while self.running.is_set():
+                if event.paused:
+                    self.pacer.tick(True)
+                    continue
+                self.game_logic.run()
+                self.game.step(self.dt)
+                self.buffer.publish(self.game.snapshot())
+                self.pacer.tick()
+        except Exception as e:
+            error("Simulation thread crashed: "+str(e)+"\n"+traceback.format_exc())
+            self.running.clear()
+
+    def is_running(self):
+        """
+        Check if the simulation thread is running.
+        """
+        return self.running.is_set()
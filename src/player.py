@@ -1,13 +1,29 @@
 from utils.sceneHandler import scene
+from utils.atlasHandler import load_group, get_frame
+from utils.eventHandler import is_pressed
 import pygame
 
 class Player(pygame.sprite.Sprite):
 
-    def __init__(self):
+    def __init__(self, controls=None, walls=None, sprite:bool = True):
+        """
+        Args:
+            controls: function telling if a key is pressed (the event bus by default).
+            walls: function giving the walls to collide with (the walls of the current map by default).
+            sprite (bool): load the sprite of the player (a blank image is used without it, for the headless runs).
+        """
         super().__init__()
-        self.sprite_sheet = pygame.image.load("assets/sprites/player/player.png")
-        self.image = self.get_image(6, 14)
-        self.image.set_colorkey((0, 0, 0))
+        self.controls = controls or is_pressed
+        self.get_walls = walls or scene.get_walls
+        # Use the baked atlas if it exists, else cut the exported sprite sheet
+        if not sprite:
+            self.image = pygame.Surface([32, 64])
+        elif load_group("player") and get_frame("player/0") is not None:
+            self.image = get_frame("player/0").copy()
+        else:
+            self.sprite_sheet = pygame.image.load("assets/sprites/player/player.png")
+            self.image = self.get_image(6, 14)
+            self.image.set_colorkey((0, 0, 0))
 
         self.rect = self.image.get_rect()
         self.feet = pygame.Rect(0, 0, 21, 16)
@@ -18,6 +34,8 @@ class Player(pygame.sprite.Sprite):
         self.linear_force = 1.0
         self.diagonal_force = (self.linear_force**2)/2**0.5
         self.friction = 0.8
+        self.walls_tested = 0
+        self.collisions = {"bouncy": 0, "sticky": 0, "solid": 0} # Number of hits of each collision type
         # After this you can add variables for the player like inventory and others stuffs :
 
     def get_image(self, x, y):
@@ -30,17 +48,15 @@ class Player(pygame.sprite.Sprite):
         self.phyiscs(dt)
 
     def move(self):
-        # Check if a key is pressed and set the player acceleration
-        pressed = pygame.key.get_pressed()
-
+        # Check if a key is pressed (from the event bus) and set the player acceleration
         self.acceleration.x, self.acceleration.y = 0, 0
-        if pressed[pygame.K_LEFT]:
+        if self.controls(pygame.K_LEFT):
             self.acceleration.x -= 1
-        if pressed[pygame.K_RIGHT]:
+        if self.controls(pygame.K_RIGHT):
             self.acceleration.x += 1
-        if pressed[pygame.K_UP]:
+        if self.controls(pygame.K_UP):
             self.acceleration.y -= 1
-        if pressed[pygame.K_DOWN]:
+        if self.controls(pygame.K_DOWN):
             self.acceleration.y += 1
         
         if self.acceleration.x != 0 and self.acceleration.y != 0:
@@ -56,8 +72,11 @@ class Player(pygame.sprite.Sprite):
         feety = pygame.Rect(self.feet.x, self.feet.y + self.velocity.y, self.feet.width, self.feet.height)
 
         # TODO: Modify the player move part so we can separate x and y
-        for wall in scene.get_walls():
+        walls = self.get_walls()
+        self.walls_tested = len(walls)
+        for wall in walls:
             if feetx.colliderect(wall["rect"]) == True:
+                self.collisions[wall["collision_type"]] = self.collisions.get(wall["collision_type"], 0) + 1
                 match wall["collision_type"]:
                     case "bouncy":
                         self.velocity.x *= -1
@@ -67,6 +86,7 @@ class Player(pygame.sprite.Sprite):
                     case "solid":
                         self.velocity.x = 0
             if feety.colliderect(wall["rect"]) == True:
+                self.collisions[wall["collision_type"]] = self.collisions.get(wall["collision_type"], 0) + 1
                 match wall["collision_type"]:
                     case "bouncy":
                         self.velocity.y *= -1
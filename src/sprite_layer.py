@@ -0,0 +1,109 @@
+# The sprite layer is the map group used to draw the sprites over the map.
+# The sprites are indexed in a grid of cells so only the ones near the view are tested and given to the renderer
+# (pyscroll already blits the sprites it gets in one call, the grid only cuts the sprites far from the view).
+# The index isn't watched: a sprite that moves must have a "dynamic" attribute set to True before it's added (it's then
+# reindexed before each draw), or be given to refresh after each move. Otherwise it's still culled with its old rect.
+import pygame, pyscroll
+
+class SpriteLayer(pyscroll.PyscrollGroup):
+
+    def __init__(self, map_layer, cell_size:int = 256, *args, **kwargs):
+        """
+        map_layer: the renderer of the map.
+        cell_size: size in pixels of the cells of the spatial index.
+        """
+        self.cell_size = cell_size
+        self.cells = {}      # (x, y) -> set of sprites
+        self.indexed = {}    # sprite -> rect it was indexed with
+        self.order = {}      # sprite -> insertion order (to keep the draw order inside a layer)
+        self.dynamic = set() # sprites checked each frame because they move by themselves
+        self.counter = 0
+        self.drawn = 0
+        pyscroll.PyscrollGroup.__init__(self, map_layer, *args, **kwargs)
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self.order[sprite] = self.counter
+        self.counter += 1
+        if getattr(sprite, "dynamic", False):
+            self.dynamic.add(sprite)
+        self.index(sprite)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.unindex(sprite)
+        self.order.pop(sprite, None)
+        self.dynamic.discard(sprite)
+
+    def get_cells(self, rect):
+        """
+        Get the cells covered by a rect.
+        """
+        size = self.cell_size
+        return [(x, y) for x in range(rect.left // size, (rect.right - 1) // size + 1)
+                       for y in range(rect.top // size, (rect.bottom - 1) // size + 1)]
+
+    def index(self, sprite):
+        """
+        Put a sprite in the cells covered by its rect.
+        """
+        rect = sprite.rect.copy()
+        for cell in self.get_cells(rect):
+            self.cells.setdefault(cell, set()).add(sprite)
+        self.indexed[sprite] = rect
+
+    def unindex(self, sprite):
+        """
+        Remove a sprite from its cells.
+        """
+        rect = self.indexed.pop(sprite, None)
+        if rect is None:
+            return
+        for cell in self.get_cells(rect):
+            self.cells[cell].discard(sprite)
+            if len(self.cells[cell]) == 0:
+                del self.cells[cell]
+
+    def refresh(self, sprite):
+        """
+        Update the index of a sprite after it moved (the dynamic sprites are refreshed automatically).
+        A sprite that isn't dynamic stays in the cells of its old rect until this is called.
+        """
+        if self.indexed.get(sprite) != sprite.rect:
+            self.unindex(sprite)
+            self.index(sprite)
+
+    def get_visible(self, view):
+        """
+        Get the sprites colliding with the view, in draw order.
+        """
+        for sprite in self.dynamic:
+            self.refresh(sprite)
+        visible = set()
+        for cell in self.get_cells(view):
+            if cell in self.cells:
+                visible.update(sprite for sprite in self.cells[cell] if sprite.rect.colliderect(view))
+        get_layer = self.get_layer_of_sprite
+        return sorted(visible, key=lambda sprite: (get_layer(sprite), self.order[sprite]))
+
+    def draw(self, surface):
+        """
+        Draw the map and the visible sprites onto the surface.
+        """
+        ox, oy = self._map_layer.get_center_offset()
+        get_layer = self.get_layer_of_sprite
+        spritedict = self.spritedict
+
+        surfaces = []
+        for sprite in self.get_visible(self.view):
+            rect = sprite.rect.move(ox, oy)
+            blendmode = getattr(sprite, "blendmode", None)
+            if blendmode is None:
+                surfaces.append((sprite.image, rect, get_layer(sprite)))
+            else:
+                surfaces.append((sprite.image, rect, get_layer(sprite), blendmode))
+            spritedict[sprite] = rect
+        self.drawn = len(surfaces)
+
+        self.lostsprites = []
+        return self._map_layer.draw(surface, surface.get_rect(), surfaces)
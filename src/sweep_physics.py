@@ -0,0 +1,180 @@
+# This file replays the player physics headless for a grid of parameters and input scripts, to tune the movement.
+# The walls come from the metadata of a map (no display and no tile is loaded), the runs are spread on a pool of worker
+# processes and their results are gathered in one report (printed, and saved as json if it's asked).
+# Usage: python src/sweep_physics.py [--scene NAME] [--map NAME] [--linear VALUES] [--diagonal VALUES] [--friction VALUES]
+#                                    [--scripts path.json] [--start X,Y] [--fps N] [--workers N] [--output path]
+# VALUES is a list "0.5,1,1.5" or a range "start:stop:step" (stop included).
+import argparse
+import json
+import os
+import time
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor
+import pygame
+from utils.consoleSystem import console
+from utils.storageHandler import param_get
+from utils.sceneHandler import scene
+from player import Player
+
+KEYS = {"left": pygame.K_LEFT, "right": pygame.K_RIGHT, "up": pygame.K_UP, "down": pygame.K_DOWN}
+
+# Input scripts: name -> {"steps": [[ticks, [keys held]], ...], "target": [x, y] (optional), "radius": px (optional)}
+SCRIPTS = {
+    "right": {"steps": [[240, ["right"]]]},
+    "diagonal": {"steps": [[180, ["right", "down"]]]},
+    "square": {"steps": [[60, ["right"]], [60, ["down"]], [60, ["left"]], [60, ["up"]]]},
+    "tap": {"steps": [[5, ["right"]], [60, []]]},
+    "portal": {"steps": [[150, ["right"]], [30, ["up"]], [60, ["right"]]], "target": [1312, 576], "radius": 24},
+}
+
+def parse_values(text:str):
+    """Read a list of numbers "a,b,c" or a range "start:stop:step" (stop included)"""
+    if ":" in text:
+        start, stop, step = (float(value) for value in text.split(":"))
+        count = int(round((stop - start) / step)) + 1
+        return [round(start + k * step, 6) for k in range(max(count, 0))]
+    return [float(value) for value in text.split(",") if value != ""]
+
+def simulate(walls:list, start:tuple, dt:float, run:tuple):
+    """
+    Replay an input script with a set of physics parameters.
+
+    Args:
+        walls (list): walls of the map (the walls of sceneHandler.read_objects).
+        start (tuple): start position of the player.
+        dt (float): time step of a tick (the one of Game.run).
+        run (tuple): (linear force, diagonal force or None for the default one, friction, script name, script).
+
+    Returns:
+        The result of the run (dict).
+    """
+    linear, diagonal, friction, name, script = run
+    held = set()
+    player = Player(controls=lambda key: key in held, walls=lambda: walls, sprite=False)
+    player.linear_force = linear
+    player.diagonal_force = diagonal if diagonal is not None else (linear**2)/2**0.5
+    player.friction = friction
+    player.position = pygame.Vector2(start)
+    player.feet.center = player.position
+
+    target = pygame.Vector2(script["target"]) if "target" in script else None
+    radius = script.get("radius", 16)
+    tick = 0
+    reached = None
+    distance = 0
+    max_speed = 0
+    for ticks, keys in script["steps"]:
+        held.clear()
+        held.update(KEYS[key] for key in keys)
+        for k in range(ticks):
+            previous = pygame.Vector2(player.position)
+            player.update(dt)
+            tick += 1
+            distance += previous.distance_to(player.position)
+            max_speed = max(max_speed, player.velocity.length() * dt)
+            if reached is None and target is not None and player.position.distance_to(target) <= radius:
+                reached = tick
+    return {"linear_force": linear, "diagonal_force": player.diagonal_force, "friction": friction, "script": name,
+            "ticks": tick, "distance": distance, "displacement": pygame.Vector2(start).distance_to(player.position),
+            "position": (player.position.x, player.position.y), "max_speed": max_speed,
+            "collisions": dict(player.collisions), "reached": reached}
+
+def simulate_batch(walls:list, start:tuple, dt:float, runs:list):
+    """Replay a batch of runs (on a worker process)"""
+    return [simulate(walls, start, dt, run) for run in runs]
+
+def get_walls(scene_name:str, map_name:str):
+    """Get the walls of a map from its metadata (the map isn't loaded)"""
+    metadata = scene.get_map_metadata(param_get(scene_name, "scenes")[map_name])
+    return scene.read_objects(metadata["objects"])["walls"]
+
+def sweep(walls:list, start:tuple, dt:float, grid:dict, scripts:dict, workers:int):
+    """
+    Replay every combination of the grid with every script.
+
+    Args:
+        grid (dict): {"linear": [...], "diagonal": [...] (None for the default one), "friction": [...]}.
+        workers (int): number of worker processes (0 to run here).
+
+    Returns:
+        The list of the results, in the order of the combinations.
+    """
+    runs = [(linear, diagonal, friction, name, scripts[name])
+            for linear, diagonal, friction, name in product(grid["linear"], grid["diagonal"], grid["friction"], scripts)]
+    if workers == 0:
+        return simulate_batch(walls, start, dt, runs)
+    # A few batches per worker, so the slow scripts are spread
+    chunk = max(1, -(-len(runs) // (workers * 4)))
+    batches = [runs[k:k + chunk] for k in range(0, len(runs), chunk)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [result for batch in pool.map(simulate_batch, [walls]*len(batches), [start]*len(batches), [dt]*len(batches), batches)
+                for result in batch]
+
+def summarize(results:list, fps:int):
+    """Gather the results by script: targets reached, best run, mean distance and collisions"""
+    summary = {}
+    for result in results:
+        script = summary.setdefault(result["script"], {"runs": 0, "reached": 0, "distance": 0, "collisions": {}, "best": None})
+        script["runs"] += 1
+        script["distance"] += result["distance"]
+        for collision_type, count in result["collisions"].items():
+            script["collisions"][collision_type] = script["collisions"].get(collision_type, 0) + count
+        if result["reached"] is not None:
+            script["reached"] += 1
+            if script["best"] is None or result["reached"] < script["best"]["reached"]:
+                script["best"] = result
+    for script in summary.values():
+        script["distance"] /= script["runs"]
+        if script["best"] is not None:
+            script["best_time"] = script["best"]["reached"] / fps
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay the player physics headless for a grid of parameters.")
+    parser.add_argument("--scene", default="scene1", help="scene of the map")
+    parser.add_argument("--map", default="testa", help="map whose walls are used")
+    parser.add_argument("--linear", default="0.5:1.5:0.25", help="values of Player.linear_force")
+    parser.add_argument("--diagonal", default=None, help="values of Player.diagonal_force (default: computed from the linear force)")
+    parser.add_argument("--friction", default="0.6:0.9:0.05", help="values of Player.friction")
+    parser.add_argument("--scripts", default=None, help="json file of input scripts (default: the built-in ones)")
+    parser.add_argument("--start", default="755,670", help="start position of the player")
+    parser.add_argument("--fps", type=int, default=60, help="frame rate simulated (the time step is the one of the game)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes (0 to run here)")
+    parser.add_argument("--output", default=None, help="json file where the report is saved")
+    args = parser.parse_args()
+
+    # Only the problems are shown while the runs are made
+    for level in ("info", "debug", "trace"):
+        console.live_active[level] = False
+        console.log_active[level] = False
+
+    scripts = SCRIPTS
+    if args.scripts is not None:
+        with open(args.scripts) as file:
+            scripts = json.load(file)
+    grid = {"linear": parse_values(args.linear),
+            "diagonal": parse_values(args.diagonal) if args.diagonal is not None else [None],
+            "friction": parse_values(args.friction)}
+    walls = get_walls(args.scene, args.map)
+    start = tuple(float(value) for value in args.start.split(","))
+    dt = 50 / args.fps
+
+    begin = time.perf_counter()
+    results = sweep(walls, start, dt, grid, scripts, max(0, args.workers))
+    elapsed = time.perf_counter() - begin
+    summary = summarize(results, args.fps)
+
+    print(str(len(results))+" runs ("+str(len(results)//max(len(scripts), 1))+" configurations x "+str(len(scripts))+" scripts) on '"
+          +args.scene+"/"+args.map+"' ("+str(len(walls))+" walls) in "+format(elapsed, ".2f")+"s with "+str(args.workers)+" workers.")
+    print(format("script", "<12")+format("reached", ">10")+format("mean dist", ">12")+format("collisions", ">12")+"  best run (linear/diagonal/friction)")
+    for name, script in summary.items():
+        best = script["best"]
+        best_text = "-" if best is None else (format(best["linear_force"], "g")+"/"+format(best["diagonal_force"], ".3g")+"/"+format(best["friction"], "g")
+                                             +" in "+format(script["best_time"], ".2f")+"s")
+        print(format(name, "<12")+format(str(script["reached"])+"/"+str(script["runs"]), ">10")+format(script["distance"], ">12.1f")
+              +format(sum(script["collisions"].values()), ">12")+"  "+best_text)
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump({"config": {"scene": args.scene, "map": args.map, "grid": grid, "start": start, "fps": args.fps, "workers": args.workers,
+                                  "elapsed": elapsed}, "scripts": scripts, "summary": summary, "results": results}, file, indent=4)
+        print("Report saved in '"+args.output+"'.")
\ No newline at end of file
@@ -0,0 +1,76 @@
+# This file reads the telemetry published by a running game (the "telemetry" option must be enabled).
+# It shows the live stats on one line, or records every new frame in a csv file. The game isn't slowed: the record is
+# read directly in the shared memory, without lock.
+# Usage: python src/telemetry_reader.py [--name NAME] [--interval S] [--record path.csv] [--duration S]
+import argparse
+import csv
+import time
+from utils.consoleSystem import console
+from utils.storageHandler import param_get
+from utils.telemetryHandler import attach, read_record, FIELDS, PHASES
+
+def wait_segment(name:str):
+    """Wait for the game to create the segment"""
+    while True:
+        try:
+            return attach(name)
+        except FileNotFoundError:
+            time.sleep(0.5)
+
+def show(record:dict):
+    """Print a record on one line"""
+    line = ("tick "+str(record["tick"])+"  "+format(record["fps"], ".1f")+" fps  "+format(record["frame_ms"], ".2f")+" ms"
+            +"  ("+" ".join(phase+" "+format(record[phase], ".2f") for phase in PHASES)+")"
+            +"  pos "+format(record["x"], ".0f")+","+format(record["y"], ".0f")
+            +"  "+record["scene_name"]+"/"+record["map_name"]
+            +"  fatal "+str(record["fatal"])+" error "+str(record["error"])+" warn "+str(record["warn"]))
+    print("\r"+line+"\033[K", end="", flush=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read the telemetry of a running game.")
+    parser.add_argument("--name", default=None, help="name of the shared memory (default: the one of the options)")
+    parser.add_argument("--interval", type=float, default=0.1, help="time in s between two reads")
+    parser.add_argument("--record", default=None, help="csv file where every new frame is recorded")
+    parser.add_argument("--duration", type=float, default=None, help="time in s before stopping (default: until the game quits)")
+    args = parser.parse_args()
+
+    # The reader only talks through its output
+    for level in ("info", "debug", "trace"):
+        console.live_active[level] = False
+        console.log_active[level] = False
+
+    name = args.name or param_get("telemetry")["name"]
+    print("Waiting for the telemetry '"+name+"'...")
+    segment = wait_segment(name)
+    file = writer = None
+    if args.record is not None:
+        file = open(args.record, "w", newline="")
+        writer = csv.writer(file)
+        writer.writerow(FIELDS)
+
+    last_sequence = None
+    last_change = start = time.time()
+    try:
+        while args.duration is None or time.time() - start < args.duration:
+            record = read_record(segment.buf)
+            if record is not None and record["sequence"] != last_sequence:
+                last_sequence = record["sequence"]
+                last_change = time.time()
+                if writer is not None:
+                    writer.writerow([record[field] for field in FIELDS])
+                else:
+                    show(record)
+            elif time.time() - last_change > 5:
+                # The game doesn't publish anymore (paused, or quit)
+                print("\nNo new frame for 5 s.")
+                last_change = time.time()
+            # The record is read at every frame of the game when recording
+            time.sleep(args.interval if writer is None else 0.001)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print()
+        if file is not None:
+            file.close()
+            print("Frames recorded in '"+args.record+"'.")
+        segment.close()
\ No newline at end of file
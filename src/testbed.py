@@ -1,4 +1,4 @@
 from utils.consoleSystem import console
 from utils.storageHandler import storage
 from utils.sceneHandler import scene
-from utils.timeToolbox import date, clock, Chrono, Timer
\ No newline at end of file
+from utils.timeToolbox import date, get_clock, Chrono, Timer
\ No newline at end of file
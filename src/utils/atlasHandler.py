@@ -0,0 +1,368 @@
+# This handler bakes the .aseprite files into texture atlases and gives their frames at runtime.
+#
+# FUNCTION:
+#  - read_aseprite: parse an .aseprite file and return its frames (surfaces and durations) and tags.
+#  - bake_group: pack all the frames of all the .aseprite files of a folder in a few atlas pages and write a metadata index.
+#  - load_group: load the atlas pages of a group (one image per page).
+#  - get_frame: get a frame by its name ("sprite/index") from the loaded groups.
+#  - get_tag: get the frame names of a tag ("sprite/tag").
+#
+# The bake is incremental: the decoded frames of each source are cached by content hash,
+# and a group is only packed again when the hash of one of its sources changed.
+import pygame
+import struct
+import zlib
+import hashlib
+import json
+import os
+from utils.consoleSystem import warn, info, debug, trace
+
+# Fast functions (function that use the atlas class to be used elsewere)
+def load_group(group:str): return atlas.load_group(group)
+def get_frame(name:str): return atlas.get_frame(name)
+def get_tag(name:str): return atlas.get_tag(name)
+
+def read_aseprite(path:str):
+    """
+    Parse an .aseprite file.
+
+    Args:
+        path (str): path of the file.
+
+    Returns:
+        A dict with the frames (list of (surface, duration)) and the tags ({name: (from, to, direction)}). None if the file can't be read.
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    if len(data) < 128 or struct.unpack_from("<H", data, 4)[0] != 0xA5E0:
+        warn("'"+str(path)+"' is not an aseprite file.")
+        return None
+    frame_count, width, height, depth = struct.unpack_from("<HHHH", data, 6)
+    transparent_index = data[28]
+
+    def read_string(offset):
+        length = struct.unpack_from("<H", data, offset)[0]
+        return data[offset+2:offset+2+length].decode("utf-8"), offset + 2 + length
+
+    def to_rgba(pixels, w, h):
+        match depth:
+            case 32:
+                return bytes(pixels[:w*h*4])
+            case 16:
+                rgba = bytearray(w*h*4)
+                rgba[0::4] = rgba[1::4] = rgba[2::4] = pixels[0:w*h*2:2]
+                rgba[3::4] = pixels[1:w*h*2:2]
+                return bytes(rgba)
+            case 8:
+                rgba = bytearray(w*h*4)
+                for k in range(w*h):
+                    index = pixels[k]
+                    if index != transparent_index and index < len(palette):
+                        rgba[k*4:k*4+4] = palette[index]
+                return bytes(rgba)
+
+    layers = []
+    tilesets = {}
+    palette = []
+    tags = {}
+    frames = []
+    offset = 128
+    for frame_index in range(frame_count):
+        frame_size, old_chunks, duration, new_chunks = struct.unpack_from("<I2xHH2xI", data, offset)
+        chunk_count = new_chunks if new_chunks != 0 else old_chunks
+        cels = []
+        position = offset + 16
+        for k in range(chunk_count):
+            chunk_size, chunk_type = struct.unpack_from("<IH", data, position)
+            chunk = position + 6
+            match chunk_type:
+                case 0x2004:
+                    # Layer (a layer is hidden if it or one of its parents is hidden)
+                    flags, layer_type, level, _, _, blend, opacity = struct.unpack_from("<HHHHHHB", data, chunk)
+                    name, end = read_string(chunk + 16)
+                    tileset = struct.unpack_from("<I", data, end)[0] if layer_type == 2 else None
+                    visible = bool(flags & 1)
+                    parents = [layer for layer in layers if layer["level"] < level]
+                    if len(parents) != 0 and parents[-1]["level"] == level - 1 and not parents[-1]["visible"]:
+                        visible = False
+                    layers.append({"name": name, "type": layer_type, "level": level, "visible": visible, "opacity": opacity, "tileset": tileset})
+                case 0x2023:
+                    # Tileset (only the ones embedded in the file, stored as a column of tiles)
+                    tileset_id, flags, tile_count, tile_w, tile_h = struct.unpack_from("<IIIHH", data, chunk)
+                    end = read_string(chunk + 32)[1]
+                    if flags & 1:
+                        end += 8
+                    if flags & 2:
+                        length = struct.unpack_from("<I", data, end)[0]
+                        pixels = zlib.decompress(data[end+4:end+4+length])
+                        image = pygame.image.frombuffer(to_rgba(pixels, tile_w, tile_h*tile_count), (tile_w, tile_h*tile_count), "RGBA").copy()
+                        tilesets[tileset_id] = [image.subsurface((0, k*tile_h, tile_w, tile_h)) for k in range(tile_count)]
+                case 0x2019:
+                    # Palette
+                    size, first, last = struct.unpack_from("<III", data, chunk)
+                    palette.extend([(0, 0, 0, 0)] * max(0, size - len(palette)))
+                    entry = chunk + 20
+                    for index in range(first, last + 1):
+                        entry_flags = struct.unpack_from("<H", data, entry)[0]
+                        palette[index] = tuple(data[entry+2:entry+6])
+                        entry += 6
+                        if entry_flags & 1:
+                            entry = read_string(entry)[1]
+                case 0x2018:
+                    # Tags
+                    count = struct.unpack_from("<H", data, chunk)[0]
+                    entry = chunk + 10
+                    for _ in range(count):
+                        start, end, direction = struct.unpack_from("<HHB", data, entry)
+                        name, entry = read_string(entry + 17)
+                        tags[name] = (start, end, direction)
+                case 0x2005:
+                    # Cel
+                    layer_index, x, y, opacity, cel_type = struct.unpack_from("<HhhBH", data, chunk)
+                    match cel_type:
+                        case 0 | 2:
+                            w, h = struct.unpack_from("<HH", data, chunk + 16)
+                            pixels = data[chunk+20:position+chunk_size]
+                            if cel_type == 2:
+                                pixels = zlib.decompress(pixels)
+                            image = pygame.image.frombuffer(to_rgba(pixels, w, h), (w, h), "RGBA").copy()
+                            cels.append((layer_index, x, y, opacity, image))
+                        case 1:
+                            linked = struct.unpack_from("<H", data, chunk + 16)[0]
+                            cels.extend([cel for cel in frames[linked][2] if cel[0] == layer_index])
+                        case 3:
+                            # Tilemap cel: draw its tiles from the tileset of the layer
+                            w, h, bits, id_mask, x_flip, y_flip = struct.unpack_from("<HHHIII", data, chunk + 16)
+                            tiles = zlib.decompress(data[chunk+48:position+chunk_size])
+                            tileset = tilesets.get(layers[layer_index]["tileset"], [])
+                            if bits != 32 or len(tileset) == 0:
+                                trace("Tilemap cel ignored in '"+str(path)+"'.")
+                                continue
+                            tile_w, tile_h = tileset[0].get_size()
+                            image = pygame.Surface((w*tile_w, h*tile_h), pygame.SRCALPHA)
+                            for k, tile in enumerate(struct.unpack_from("<"+str(w*h)+"I", tiles)):
+                                tile_id = tile & id_mask
+                                if tile_id != 0 and tile_id < len(tileset):
+                                    tile_image = pygame.transform.flip(tileset[tile_id], bool(tile & x_flip), bool(tile & y_flip))
+                                    image.blit(tile_image, ((k % w)*tile_w, (k // w)*tile_h))
+                            cels.append((layer_index, x, y, opacity, image))
+            position += chunk_size
+
+        # Flatten the visible layers of the frame
+        surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        for layer_index, x, y, opacity, image in sorted(cels, key=lambda cel: cel[0]):
+            layer = layers[layer_index]
+            if layer["visible"] and layer["type"] != 1:
+                alpha = opacity * layer["opacity"] // 255
+                if alpha != 255:
+                    image = image.copy()
+                    image.set_alpha(alpha)
+                surface.blit(image, (x, y))
+        frames.append((surface, duration, cels))
+        offset += frame_size
+
+    return {"frames": [(surface, duration) for surface, duration, cels in frames], "tags": tags}
+
+class atlasHandler:
+
+    def __init__(self):
+        # Setting up the atlas handler
+        self.atlas_folder_path = "assets/atlases/"
+        self.cache_folder_path = self.atlas_folder_path + ".cache/"
+        self.page_size = 1024
+        self.cache_version = "1" # Change it when the parser output changes, to invalidate the cache
+        self.pages = {}
+        self.frames = {}
+        self.tags = {}
+        info("Atlas handler initialized.")
+
+    def quit(self):
+        info("Atlas handler has quit.")
+
+    ########
+    # BAKE #
+    ########
+
+    def read_source(self, path:str):
+        """
+        Read the frames of an .aseprite file, from the cache if its content didn't change.
+
+        Returns:
+            (hash, frames, tags) with frames as a list of (surface, duration). None if the file can't be read.
+        """
+        with open(path, "rb") as file:
+            digest = hashlib.sha1(self.cache_version.encode() + file.read()).hexdigest()
+        cache = self.cache_folder_path + digest
+        if os.path.exists(cache + ".png") and os.path.exists(cache + ".json"):
+            with open(cache + ".json") as file:
+                meta = json.load(file)
+            strip = pygame.image.load(cache + ".png")
+            w, h = meta["size"]
+            frames = [(strip.subsurface((k*w, 0, w, h)).copy(), duration) for k, duration in enumerate(meta["durations"])]
+            trace("'"+path+"' read from the cache.")
+            return digest, frames, meta["tags"]
+
+        sprite = read_aseprite(path)
+        if sprite is None:
+            return None
+        if len(sprite["frames"]) == 0:
+            warn("'"+str(path)+"' has no frame.")
+            return None
+        w, h = sprite["frames"][0][0].get_size()
+        strip = pygame.Surface((w*len(sprite["frames"]), h), pygame.SRCALPHA)
+        for k, (surface, duration) in enumerate(sprite["frames"]):
+            strip.blit(surface, (k*w, 0))
+        os.makedirs(self.cache_folder_path, exist_ok=True)
+        pygame.image.save(strip, cache + ".png")
+        with open(cache + ".json", "w") as file:
+            json.dump({"size": [w, h], "durations": [d for s, d in sprite["frames"]], "tags": sprite["tags"]}, file)
+        return digest, sprite["frames"], sprite["tags"]
+
+    def pack(self, sizes:list):
+        """
+        Place rectangles on atlas pages with a shelf packing (the tallest first).
+
+        Args:
+            sizes (list): list of (w, h).
+
+        Returns:
+            A list of (page, x, y) in the order of the sizes.
+        """
+        order = sorted(range(len(sizes)), key=lambda k: (-sizes[k][1], -sizes[k][0]))
+        places = [None]*len(sizes)
+        page, x, y, shelf = 0, 0, 0, 0
+        for k in order:
+            w, h = sizes[k]
+            if x + w > self.page_size:
+                x, y, shelf = 0, y + shelf, 0
+            if y + h > self.page_size:
+                page, x, y, shelf = page + 1, 0, 0, 0
+            places[k] = (page, x, y)
+            x += w
+            shelf = max(shelf, h)
+        return places
+
+    def bake_group(self, source_folder:str, group:str=None, force:bool=False):
+        """
+        Bake all the .aseprite files of a folder into the atlas pages of a group.
+
+        Args:
+            source_folder (str): folder of the .aseprite files.
+            group (str): name of the group (the folder name by default).
+            force (bool): bake even if no source changed.
+
+        Returns:
+            True if the group has been baked, False if it was up to date or if there is nothing to bake.
+        """
+        if group is None:
+            group = os.path.basename(os.path.normpath(source_folder))
+        paths = sorted(os.path.join(source_folder, f) for f in os.listdir(source_folder) if f.endswith(".aseprite"))
+        if len(paths) == 0:
+            warn("No aseprite files in '"+source_folder+"'.")
+            return False
+
+        # Skip the group if no source changed since the last bake
+        hashes = {}
+        for path in paths:
+            with open(path, "rb") as file:
+                hashes[os.path.basename(path)] = hashlib.sha1(self.cache_version.encode() + file.read()).hexdigest()
+        index_path = self.atlas_folder_path + group + ".json"
+        if not force and os.path.exists(index_path):
+            with open(index_path) as file:
+                if json.load(file).get("sources") == hashes:
+                    debug("Atlas '"+group+"' is up to date.")
+                    return False
+
+        # Gather the frames of all the sprites
+        names, surfaces, durations, tags = [], [], [], {}
+        for path in paths:
+            source = self.read_source(path)
+            if source is None:
+                continue
+            sprite = os.path.basename(path).rsplit(".", 1)[0]
+            # The frames of a sprite all have the size of its canvas
+            w, h = source[1][0][0].get_size()
+            if w > self.page_size or h > self.page_size:
+                warn("The frames of '"+path+"' ("+str(w)+"x"+str(h)+") are larger than an atlas page ("+str(self.page_size)+"), it's skipped.")
+                continue
+            for k, (surface, duration) in enumerate(source[1]):
+                names.append(sprite+"/"+str(k))
+                surfaces.append(surface)
+                durations.append(duration)
+            for tag, (start, end, direction) in source[2].items():
+                tags[sprite+"/"+tag] = {"frames": [sprite+"/"+str(k) for k in range(start, end + 1)], "direction": direction}
+
+        if len(names) == 0:
+            warn("No frame could be read in '"+source_folder+"', the atlas '"+group+"' isn't baked.")
+            return False
+
+        # Pack them and write the pages and the index
+        places = self.pack([surface.get_size() for surface in surfaces])
+        page_count = max(place[0] for place in places) + 1
+        pages = [pygame.Surface((self.page_size, self.page_size), pygame.SRCALPHA) for _ in range(page_count)]
+        index = {"pages": [], "frames": {}, "tags": tags, "sources": hashes}
+        for name, surface, duration, (page, x, y) in zip(names, surfaces, durations, places):
+            pages[page].blit(surface, (x, y))
+            index["frames"][name] = {"page": page, "rect": [x, y, surface.get_width(), surface.get_height()], "duration": duration}
+        os.makedirs(self.atlas_folder_path, exist_ok=True)
+        for page, surface in enumerate(pages):
+            index["pages"].append(group+"_"+str(page)+".png")
+            pygame.image.save(surface, self.atlas_folder_path + index["pages"][-1])
+        with open(index_path, "w") as file:
+            json.dump(index, file, indent=4)
+        info("Atlas '"+group+"' baked ("+str(len(names))+" frames on "+str(page_count)+" pages).")
+        return True
+
+    ###########
+    # RUNTIME #
+    ###########
+
+    def load_group(self, group:str):
+        """
+        Load the atlas pages of a group and index its frames.
+
+        Returns:
+            True if the group is loaded. False otherwise.
+        """
+        if group in self.pages:
+            return True
+        index_path = self.atlas_folder_path + group + ".json"
+        if not os.path.exists(index_path):
+            debug("No atlas for the group '"+group+"'.")
+            return False
+        with open(index_path) as file:
+            index = json.load(file)
+        self.pages[group] = [pygame.image.load(self.atlas_folder_path + page) for page in index["pages"]]
+        if pygame.display.get_surface() is not None:
+            self.pages[group] = [page.convert_alpha() for page in self.pages[group]]
+        for name, frame in index["frames"].items():
+            self.frames[name] = (self.pages[group][frame["page"]].subsurface(frame["rect"]), frame["duration"])
+        for name, tag in index["tags"].items():
+            self.tags[name] = tag["frames"]
+        trace("Atlas '"+group+"' loaded.")
+        return True
+
+    def get_frame(self, name:str):
+        """
+        Get a frame surface by its name ("sprite/index"). None if it doesn't exist.
+        """
+        if name in self.frames:
+            return self.frames[name][0]
+        return None
+
+    def get_duration(self, name:str):
+        """
+        Get a frame duration in ms. None if it doesn't exist.
+        """
+        if name in self.frames:
+            return self.frames[name][1]
+        return None
+
+    def get_tag(self, name:str):
+        """
+        Get the frame names of a tag ("sprite/tag"). An empty list if it doesn't exist.
+        """
+        return self.tags.get(name, [])
+
+# Set the atlas object
+atlas = atlasHandler()
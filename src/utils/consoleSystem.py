@@ -31,6 +31,8 @@ class consoleHandler:
         self.live_time = self.log_option["live_time"]
         self.log_time = self.log_option["log_time"]
         self.logs = []
+        # Number of messages of the problem levels (they are published by the telemetry)
+        self.counts = {"fatal": 0, "error": 0, "warn": 0}
 
         # Colors and heading messages
         colorama.init(autoreset=True)
@@ -94,6 +96,7 @@ class consoleHandler:
 
     # Logs functions
     def fatal(self, msg):
+        self.counts["fatal"] += 1
         if self.live_active["fatal"]:
             if self.live_time:
                 print("("+date.get_formated_time()+") "+self.FATAL_LIVE_PREFIX + str(msg))
@@ -106,6 +109,7 @@ class consoleHandler:
                 self.logs.append(self.FATAL_LOG_PREFIX + str(msg))
             
     def error(self, msg):
+        self.counts["error"] += 1
         if self.live_active["error"]:
             if self.live_time:
                 print("("+date.get_formated_time()+") "+self.ERROR_LIVE_PREFIX + str(msg))
@@ -118,6 +122,7 @@ class consoleHandler:
                 self.logs.append(self.ERROR_LOG_PREFIX + str(msg))
             
     def warn(self, msg):
+        self.counts["warn"] += 1
         if self.live_active["warn"]:
             if self.live_time:
                 print("("+date.get_formated_time()+") "+self.WARN_LIVE_PREFIX + str(msg))
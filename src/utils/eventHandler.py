@@ -0,0 +1,115 @@
+# This is the event bus. It drains the pygame queue once per frame and routes the events to the subscribed handlers.
+#
+# FUNCTION:
+#  - subscribe: call a handler for an event type (and optionally only for one key).
+#  - unsubscribe: stop calling a handler.
+#  - is_pressed: check if a key is pressed (from the keyboard state taken once per frame).
+#
+# The event types nobody subscribed to are blocked, so pygame doesn't queue them.
+# When the game is paused, the dispatch waits for an event instead of spinning.
+import pygame
+from utils.consoleSystem import info, trace
+
+# Fast functions (function that use the event class to be used elsewere)
+def subscribe(event_type:int, handler, key:int=None): return event.subscribe(event_type, handler, key)
+def unsubscribe(event_type:int, handler): return event.unsubscribe(event_type, handler)
+def is_pressed(key:int): return event.is_pressed(key)
+
+class eventHandler:
+
+    def __init__(self):
+        # Setting up the event bus
+        self.handlers = {}  # event type -> list of (handler, key)
+        self.keys = None
+        self.paused = False
+        self.wait_timeout = 100 # Time in ms the dispatch waits for an event when paused
+        # Always let these events through, the window state depends on them
+        self.base_types = {pygame.QUIT, pygame.WINDOWFOCUSLOST, pygame.WINDOWFOCUSGAINED, pygame.WINDOWMINIMIZED, pygame.WINDOWRESTORED}
+        info("Event handler initialized.")
+
+    def quit(self):
+        info("Event handler has quit.")
+
+    def start(self):
+        """
+        Apply the event filter (pygame has to be initialized).
+        """
+        self.update_filter()
+        self.keys = pygame.key.get_pressed()
+
+    def update_filter(self):
+        """
+        Block all the event types that have no handler.
+        """
+        if not pygame.display.get_init():
+            return
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed(list(self.base_types | set(self.handlers)))
+
+    def subscribe(self, event_type:int, handler, key:int=None):
+        """
+        Subscribe a handler to an event type.
+
+        Args:
+            event_type (int): pygame event type.
+            handler: function called with the event.
+            key (int): if set, the handler is only called for this key (KEYDOWN and KEYUP).
+        """
+        self.handlers.setdefault(event_type, []).append((handler, key))
+        self.update_filter()
+        trace("Handler subscribed to '"+pygame.event.event_name(event_type)+"'.")
+
+    def unsubscribe(self, event_type:int, handler):
+        """
+        Unsubscribe a handler from an event type.
+
+        Returns:
+            True if the handler was subscribed. False otherwise.
+        """
+        if event_type not in self.handlers:
+            return False
+        handlers = [entry for entry in self.handlers[event_type] if entry[0] != handler]
+        found = len(handlers) != len(self.handlers[event_type])
+        if len(handlers) == 0:
+            del self.handlers[event_type]
+            self.update_filter()
+        else:
+            self.handlers[event_type] = handlers
+        return found
+
+    def dispatch(self):
+        """
+        Drain the queue and route the events. When paused, wait for an event (with a timeout) before draining.
+        """
+        events = []
+        if self.paused:
+            waited = pygame.event.wait(self.wait_timeout)
+            if waited.type != pygame.NOEVENT:
+                events.append(waited)
+        events.extend(pygame.event.get())
+
+        for e in events:
+            for handler, key in self.handlers.get(e.type, ()):
+                if key is None or getattr(e, "key", None) == key:
+                    handler(e)
+
+        # The keyboard state is taken once and shared by every system
+        self.keys = pygame.key.get_pressed()
+
+    def is_pressed(self, key:int):
+        """
+        Check if a key is pressed.
+        """
+        if self.keys is None:
+            return False
+        return self.keys[key]
+
+    def set_pause(self, paused:bool = None):
+        """
+        Pause or resume (toggle if nothing is given).
+        """
+        self.paused = not self.paused if paused is None else paused
+        trace("Game paused." if self.paused else "Game resumed.")
+
+# Set the event object
+event = eventHandler()
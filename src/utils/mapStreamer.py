@@ -0,0 +1,270 @@
+# This file streams the big maps by chunks around the camera.
+# Only the header, the tilesets and the byte offset of each row of tiles are read when the map is loaded.
+# The tiles of a chunk are read from the file on a worker thread when the camera comes near it,
+# and the chunk is dropped when the camera goes far enough, so the memory depends on the view and not on the map.
+import pygame, pytmx, pyscroll
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+from array import array
+from concurrent.futures import wait
+from utils.consoleSystem import trace
+
+# Flags stored in the high bits of the tiles gids
+GID_MASK = 0x1FFFFFFF
+ATTRIBUTES = re.compile(rb'([\w:-]+)="([^"]*)"')
+
+def read_attributes(line:bytes):
+    """Read the attributes of the xml tag on a line"""
+    return {key.decode(): value.decode() for key, value in ATTRIBUTES.findall(line)}
+
+def index_map(path:str):
+    """
+    Index a map without reading its tiles: size, tilesets, and the byte offset of every row of every tile layer.
+    Only the csv encoding is supported (one row of tiles per line, as tiled writes it).
+
+    Returns:
+        The index (dict). Raise a ValueError if the map can't be streamed.
+    """
+    index = {"tilesets": [], "layers": {}, "visible_layers": []}
+    number = -1 # Layer number, with the same numbering as pytmx (object groups count)
+    rows = None
+    in_tileset = False # The object groups of an embedded tileset are the shapes of its tiles, not layers
+    offset = 0
+    with open(path, "rb") as file:
+        for line in file:
+            stripped = line.strip()
+            if rows is not None:
+                if stripped.startswith(b"</data"):
+                    index["layers"][number] = rows
+                    rows = None
+                elif stripped:
+                    rows.append(offset)
+            elif stripped.startswith(b"<map "):
+                attributes = read_attributes(stripped)
+                if attributes.get("infinite", "0") != "0":
+                    raise ValueError("infinite maps can't be streamed")
+                index.update({key: int(attributes[key]) for key in ("width", "height", "tilewidth", "tileheight")})
+            elif stripped.startswith(b"<tileset "):
+                index["tilesets"].append(read_attributes(stripped))
+                in_tileset = not stripped.endswith(b"/>")
+            elif stripped.startswith(b"</tileset"):
+                in_tileset = False
+            elif in_tileset:
+                if stripped.startswith(b"<image ") and "image" not in index["tilesets"][-1]:
+                    index["tilesets"][-1]["image"] = read_attributes(stripped)
+            elif stripped.startswith(b"<layer "):
+                number += 1
+                if read_attributes(stripped).get("visible", "1") != "0":
+                    index["visible_layers"].append(number)
+            elif stripped.startswith(b"<objectgroup") or stripped.startswith(b"<imagelayer") or stripped.startswith(b"<group"):
+                number += 1
+            elif stripped.startswith(b"<data"):
+                if read_attributes(stripped).get("encoding") != "csv":
+                    raise ValueError("only the csv encoded layers can be streamed")
+                rows = array("q")
+            offset += len(line)
+    return index
+
+def load_tilesets(path:str, tilesets:list):
+    """
+    Load the tiles images of the tilesets of a map (on the main thread, they are converted).
+
+    Returns:
+        The list of the tiles images, indexed by gid.
+    """
+    images = [None]
+    folder = os.path.dirname(path)
+    for tileset in tilesets:
+        attributes = dict(tileset)
+        image = attributes.pop("image", None)
+        source_folder = folder
+        if "source" in attributes:
+            source = os.path.join(folder, attributes["source"])
+            source_folder = os.path.dirname(source)
+            root = ElementTree.parse(source).getroot()
+            attributes.update(root.attrib)
+            image = root.find("image").attrib
+        firstgid = int(attributes["firstgid"])
+        width, height = int(attributes["tilewidth"]), int(attributes["tileheight"])
+        spacing, margin = int(attributes.get("spacing", 0)), int(attributes.get("margin", 0))
+        sheet = pygame.image.load(os.path.join(source_folder, image["source"]))
+        sheet = sheet.convert_alpha() if "trans" not in image else sheet.convert()
+        if "trans" in image:
+            sheet.set_colorkey(pygame.Color("#"+image["trans"]))
+        columns = int(attributes.get("columns", (sheet.get_width() - margin + spacing) // (width + spacing)))
+        count = int(attributes.get("tilecount", columns * ((sheet.get_height() - margin + spacing) // (height + spacing))))
+        images.extend([None] * (firstgid + count - len(images)))
+        for k in range(count):
+            x = margin + (k % columns) * (width + spacing)
+            y = margin + (k // columns) * (height + spacing)
+            images[firstgid + k] = sheet.subsurface((x, y, width, height))
+    return images
+
+def read_chunk(path:str, layers:dict, width:int, chunk_size:int, cx:int, cy:int):
+    """
+    Read the tiles of a chunk in every tile layer (run on a worker thread).
+
+    Returns:
+        The chunk (dict): layer number -> rows of gids.
+    """
+    chunk = {}
+    start, end = cx * chunk_size, min((cx + 1) * chunk_size, width)
+    with open(path, "rb") as file:
+        for number, rows in layers.items():
+            tiles = []
+            for offset in rows[cy * chunk_size:(cy + 1) * chunk_size]:
+                file.seek(offset)
+                row = file.readline().split(b",", end)
+                tiles.append(array("L", map(int, row[start:end])))
+            chunk[number] = tiles
+    return chunk
+
+class streamedMapData(pyscroll.PyscrollDataAdapter):
+    """Map data where the tiles are loaded by chunks around a position"""
+
+    def __init__(self, path:str, index:dict, pool, chunk_size:int = 32, load_radius:int = 2, evict_radius:int = 3):
+        super().__init__()
+        self.path = path
+        self.index = index
+        self.pool = pool
+        self.chunk_size = chunk_size
+        self.load_radius = load_radius
+        self.evict_radius = max(evict_radius, load_radius + 1)
+        self.images = load_tilesets(path, index["tilesets"])
+        self.flipped = {} # Transformed images of the flipped gids
+        self.chunks = {}  # (cx, cy) -> chunk
+        self.pending = {} # (cx, cy) -> future of the chunk
+        self.arrived = [] # Chunks loaded since the last draw, their tiles are queued on the buffer
+        self.stats = {"loads": 0, "evictions": 0}
+
+    @property
+    def tile_size(self):
+        return self.index["tilewidth"], self.index["tileheight"]
+
+    @property
+    def map_size(self):
+        return self.index["width"], self.index["height"]
+
+    @property
+    def visible_tile_layers(self):
+        return self.index["visible_layers"]
+
+    def reload_data(self):
+        self.close()
+        self.chunks = {}
+
+    def get_animations(self):
+        return ()
+
+    def get_image(self, gid:int):
+        """Get the image of a gid, with its flips"""
+        if gid <= GID_MASK:
+            return self.images[gid] if gid < len(self.images) else None
+        if gid not in self.flipped:
+            flags = pytmx.TileFlags(bool(gid & 0x80000000), bool(gid & 0x40000000), bool(gid & 0x20000000))
+            image = self.get_image(gid & GID_MASK)
+            self.flipped[gid] = pytmx.util_pygame.handle_transformation(image, flags) if image else None
+        return self.flipped[gid]
+
+    def _get_tile_image(self, x, y, l):
+        chunk = self.chunks.get((x // self.chunk_size, y // self.chunk_size))
+        if chunk is None or l not in chunk:
+            return None
+        try:
+            gid = chunk[l][y % self.chunk_size][x % self.chunk_size]
+        except IndexError:
+            return None
+        return self.get_image(gid) if gid else None
+
+    def _get_tile_image_by_id(self, id):
+        return self.get_image(id)
+
+    def get_tile_images_by_rect(self, rect):
+        x1, y1, x2, y2 = pyscroll.common.rect_to_bb(rect)
+        x1, y1 = max(x1, 0), max(y1, 0)
+        size = self.chunk_size
+        for l in self.visible_tile_layers:
+            for y in range(y1, min(y2, self.index["height"] - 1) + 1):
+                for cx in range(x1 // size, min(x2, self.index["width"] - 1) // size + 1):
+                    chunk = self.chunks.get((cx, y // size))
+                    if chunk is None or l not in chunk:
+                        continue
+                    row = chunk[l][y % size]
+                    for x in range(max(x1, cx * size), min(x2 + 1, cx * size + len(row))):
+                        gid = row[x - cx * size]
+                        if gid:
+                            tile = self.get_image(gid)
+                            if tile:
+                                yield x, y, l, tile
+
+    def process_animation_queue(self, tile_view):
+        # The chunks that arrived since the last draw are drawn on the part of the buffer they cover
+        if len(self.arrived) == 0:
+            return []
+        size = self.chunk_size
+        new_tiles = []
+        for cx, cy in self.arrived:
+            rect = pygame.Rect(cx * size, cy * size, size, size).clip(tile_view)
+            if rect.width != 0 and rect.height != 0:
+                new_tiles.extend(self.get_tile_images_by_rect(rect))
+        self.arrived = []
+        return new_tiles
+
+    def stream(self, position):
+        """
+        Load the chunks around a position (in pixels) and drop the far ones. The chunk of the position is waited for.
+
+        Returns:
+            The list of the chunks added and the list of the chunks removed.
+        """
+        size = self.chunk_size
+        center = (int(position[0]) // self.index["tilewidth"] // size, int(position[1]) // self.index["tileheight"] // size)
+        columns = -(-self.index["width"] // size)
+        rows = -(-self.index["height"] // size)
+
+        # Ask the missing chunks of the load radius
+        for cy in range(max(0, center[1] - self.load_radius), min(rows, center[1] + self.load_radius + 1)):
+            for cx in range(max(0, center[0] - self.load_radius), min(columns, center[0] + self.load_radius + 1)):
+                if (cx, cy) not in self.chunks and (cx, cy) not in self.pending:
+                    self.pending[(cx, cy)] = self.pool.submit(read_chunk, self.path, self.index["layers"], self.index["width"], size, cx, cy)
+        if center in self.pending:
+            wait([self.pending[center]])
+
+        # Keep the chunks that are read
+        added = []
+        for key, future in list(self.pending.items()):
+            if future.done():
+                del self.pending[key]
+                if not future.cancelled():
+                    self.chunks[key] = future.result()
+                    self.arrived.append(key)
+                    added.append(key)
+                    self.stats["loads"] += 1
+
+        # Drop the chunks out of the evict radius
+        removed = []
+        for key in list(self.chunks):
+            if max(abs(key[0] - center[0]), abs(key[1] - center[1])) > self.evict_radius:
+                del self.chunks[key]
+                removed.append(key)
+                self.stats["evictions"] += 1
+        for key in list(self.pending):
+            if max(abs(key[0] - center[0]), abs(key[1] - center[1])) > self.evict_radius:
+                self.pending.pop(key).cancel()
+        if len(added) + len(removed) != 0:
+            trace(os.path.basename(self.path)+": "+str(len(added))+" chunks loaded, "+str(len(removed))+" dropped ("+str(len(self.chunks))+" in memory).")
+        return added, removed
+
+    def get_chunks(self, rect):
+        """Get the keys of the chunks covered by a rect in pixels"""
+        width = self.chunk_size * self.index["tilewidth"]
+        height = self.chunk_size * self.index["tileheight"]
+        return [(cx, cy) for cy in range(int(rect[1]) // height, int(rect[1] + max(rect[3] - 1, 0)) // height + 1)
+                         for cx in range(int(rect[0]) // width, int(rect[0] + max(rect[2] - 1, 0)) // width + 1)]
+
+    def close(self):
+        """Cancel the chunks still being read"""
+        for future in self.pending.values():
+            future.cancel()
+        self.pending = {}
\ No newline at end of file
@@ -0,0 +1,246 @@
+# This handler gives the pathfinding of the NPCs.
+#
+# FUNCTION:
+#  - build_nav_grid: rasterize the walls of a map into a navigation grid (one byte per cell, 1 if blocked).
+#  - find_path: find a path of cells with A* (8 directions, no corner cutting).
+#  - get_path: get a path in world coordinates, from the cache of the recent paths if possible.
+#  - replan: fix a path after the grid changed, by only searching again around the blocked part.
+#  - get_paths: answer many path queries at once, optionally on a pool of worker processes.
+import heapq
+from itertools import count
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from utils.consoleSystem import info, trace
+
+# Fast functions (function that use the navigation class to be used elsewere)
+def get_path(grid, start, goal): return navigation.get_path(grid, start, goal)
+def get_paths(grid, queries:list, workers:int=None): return navigation.get_paths(grid, queries, workers)
+def replan(grid, path:list, position, goal): return navigation.replan(grid, path, position, goal)
+
+# Identities of the grids (id() can be reused by a new grid once the old one is freed)
+grid_identities = count()
+
+class navGrid:
+    """A compact grid of the blocked cells of a map"""
+
+    def __init__(self, width:int, height:int, cell_size:int):
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.cells = bytearray(width * height)
+        self.identity = next(grid_identities) # Unique for the whole run, it keys the cached paths
+        self.version = 0 # Changed each time the grid is modified, so the cached paths are not reused
+
+    def block(self, rect, blocked:bool = True):
+        """Mark the cells covered by a rect as blocked (or free)"""
+        size = self.cell_size
+        for y in range(max(0, rect[1] // size), min(self.height, (rect[1] + rect[3] - 1) // size + 1)):
+            start = y * self.width
+            left = max(0, rect[0] // size)
+            right = min(self.width, (rect[0] + rect[2] - 1) // size + 1)
+            if right > left:
+                self.cells[start + left:start + right] = (b"\x01" if blocked else b"\x00") * (right - left)
+        self.version += 1
+
+    def is_free(self, x:int, y:int):
+        """Check if a cell is inside the grid and not blocked"""
+        return 0 <= x < self.width and 0 <= y < self.height and self.cells[y * self.width + x] == 0
+
+    def to_cell(self, position):
+        """Get the cell of a world position"""
+        return (int(position[0]) // self.cell_size, int(position[1]) // self.cell_size)
+
+    def to_world(self, cell):
+        """Get the world position of the center of a cell"""
+        return (cell[0] * self.cell_size + self.cell_size // 2, cell[1] * self.cell_size + self.cell_size // 2)
+
+def build_nav_grid(walls:list, width:int, height:int, cell_size:int):
+    """
+    Rasterize walls into a navigation grid.
+
+    Args:
+        walls (list): walls of the map ({"rect", "collision_type"}).
+        width (int): width of the map in pixels.
+        height (int): height of the map in pixels.
+        cell_size (int): size of a cell in pixels.
+
+    Returns:
+        The navigation grid (navGrid).
+    """
+    grid = navGrid(-(-width // cell_size), -(-height // cell_size), cell_size)
+    for wall in walls:
+        grid.block(wall["rect"])
+    grid.version = 0
+    return grid
+
+def find_path(grid:navGrid, start, goal):
+    """
+    Find a path between two cells with A*.
+
+    Returns:
+        The list of cells from start to goal (both included). None if there is no path.
+    """
+    if not grid.is_free(*start) or not grid.is_free(*goal):
+        return None
+    width = grid.width
+    cells = grid.cells
+    diagonal = 2 ** 0.5 - 2
+
+    def heuristic(x, y):
+        # Octile distance
+        dx, dy = abs(x - goal[0]), abs(y - goal[1])
+        return dx + dy + diagonal * min(dx, dy)
+
+    costs = {start: 0}
+    parents = {start: None}
+    opened = [(heuristic(*start), 0, start)]
+    while len(opened) != 0:
+        _, cost, cell = heapq.heappop(opened)
+        if cell == goal:
+            path = []
+            while cell is not None:
+                path.append(cell)
+                cell = parents[cell]
+            return path[::-1]
+        if cost > costs[cell]:
+            continue
+        x, y = cell
+        for dx, dy, step in ((1, 0, 1), (-1, 0, 1), (0, 1, 1), (0, -1, 1),
+                             (1, 1, 1.4142135623730951), (1, -1, 1.4142135623730951), (-1, 1, 1.4142135623730951), (-1, -1, 1.4142135623730951)):
+            nx, ny = x + dx, y + dy
+            if not (0 <= nx < width and 0 <= ny < grid.height) or cells[ny * width + nx]:
+                continue
+            # No corner cutting on the diagonals
+            if dx != 0 and dy != 0 and (cells[y * width + nx] or cells[ny * width + x]):
+                continue
+            new_cost = cost + step
+            if new_cost < costs.get((nx, ny), float("inf")):
+                costs[(nx, ny)] = new_cost
+                parents[(nx, ny)] = cell
+                heapq.heappush(opened, (new_cost + heuristic(nx, ny), new_cost, (nx, ny)))
+    return None
+
+def find_paths(grid:navGrid, queries:list):
+    """Find the paths of many (start, goal) cells queries (used by the worker processes)"""
+    return [find_path(grid, start, goal) for start, goal in queries]
+
+class navigationHandler:
+
+    def __init__(self, cache_size:int = 1024):
+        # Setting up the navigation handler
+        self.cache = OrderedDict() # (grid identity, grid version, start cell, goal cell) -> path of cells
+        self.cache_size = cache_size
+        self.stats = {"hits": 0, "misses": 0}
+        self.pool = None
+        self.pool_workers = 0 # Number of worker processes of the pool
+        info("Navigation handler initialized.")
+
+    def quit(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+        info("Navigation handler has quit.")
+
+    def cache_get(self, key):
+        """Get a path from the cache (None if it's not there) and mark it as recently used"""
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.stats["hits"] += 1
+            return self.cache[key]
+        self.stats["misses"] += 1
+        return None
+
+    def cache_set(self, key, path):
+        """Save a path in the cache, the least recently used one is dropped when it's full"""
+        self.cache[key] = path
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def get_path(self, grid:navGrid, start, goal):
+        """
+        Get a path between two world positions.
+
+        Returns:
+            The list of world positions (centers of the cells). None if there is no path.
+        """
+        key = (grid.identity, grid.version, grid.to_cell(start), grid.to_cell(goal))
+        cells = self.cache_get(key)
+        if cells is None and key not in self.cache:
+            cells = find_path(grid, key[2], key[3])
+            self.cache_set(key, cells)
+        if cells is None:
+            return None
+        return [grid.to_world(cell) for cell in cells]
+
+    def replan(self, grid:navGrid, path:list, position, goal):
+        """
+        Fix the rest of a path after the grid changed. Only the blocked part is searched again,
+        from the current position to the first free point after it. A full search is done if it can't rejoin.
+
+        Returns:
+            The new list of world positions. None if there is no path anymore.
+        """
+        cells = [grid.to_cell(point) for point in path]
+        current = grid.to_cell(position)
+        if current in cells:
+            cells = cells[cells.index(current):]
+        blocked = [k for k, cell in enumerate(cells) if not grid.is_free(*cell)]
+        if len(blocked) == 0:
+            return [grid.to_world(cell) for cell in cells]
+
+        # Rejoin the old path just after its last blocked cell
+        rejoin = blocked[-1] + 1
+        if rejoin < len(cells):
+            detour = find_path(grid, current, cells[rejoin])
+            if detour is not None:
+                trace("Path replanned around "+str(len(blocked))+" blocked cells.")
+                return [grid.to_world(cell) for cell in detour + cells[rejoin + 1:]]
+        return self.get_path(grid, position, goal)
+
+    def get_paths(self, grid:navGrid, queries:list, workers:int = None):
+        """
+        Answer many path queries at once. The cache is checked first, then the missing paths are searched,
+        on a pool of worker processes if workers is set.
+
+        Args:
+            queries (list): list of (start, goal) world positions.
+            workers (int): number of worker processes (None to search on this thread).
+
+        Returns:
+            The list of paths (list of world positions or None), in the order of the queries.
+        """
+        keys = [(grid.identity, grid.version, grid.to_cell(start), grid.to_cell(goal)) for start, goal in queries]
+        # The answers of the batch are kept here, the cache can drop some of them if the batch is bigger than it
+        found = {}
+        missing = []
+        for key in keys:
+            if key in found:
+                continue
+            if key in self.cache:
+                found[key] = self.cache_get(key)
+            else:
+                found[key] = None
+                missing.append(key)
+                self.stats["misses"] += 1
+
+        if len(missing) != 0:
+            searches = [(key[2], key[3]) for key in missing]
+            if workers:
+                if self.pool is None or self.pool_workers != workers:
+                    if self.pool is not None:
+                        self.pool.shutdown()
+                    self.pool = ProcessPoolExecutor(max_workers=workers)
+                    self.pool_workers = workers
+                chunk = -(-len(searches) // workers)
+                batches = [searches[k:k + chunk] for k in range(0, len(searches), chunk)]
+                results = [path for batch in self.pool.map(find_paths, [grid]*len(batches), batches) for path in batch]
+            else:
+                results = find_paths(grid, searches)
+            for key, cells in zip(missing, results):
+                found[key] = cells
+                self.cache_set(key, cells)
+
+        return [None if found[key] is None else [grid.to_world(cell) for cell in found[key]] for key in keys]
+
+# Set the navigation object
+navigation = navigationHandler()
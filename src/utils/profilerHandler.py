@@ -0,0 +1,167 @@
+# This handler profiles the main thread while the game runs.
+#
+# FUNCTION:
+#  - start: start a profiling session.
+#  - stop: stop the session and write its files next to logs.log.
+#  - toggle: start or stop a session.
+#
+# The default mode is a sampler: a profiling timer (signal.setitimer) interrupts the main thread every few ms of cpu time
+# and its stack is counted, so the cost doesn't depend on the number of calls. Where there is no setitimer (windows),
+# or when it's asked, cProfile is used instead (every call is measured, it's slower).
+# A session writes a collapsed stacks file (flamegraph ready, sampler only), a pstats file and a json file of metadata.
+import cProfile
+import json
+import marshal
+import os
+import signal
+import time
+from utils.storageHandler import param_get
+from utils.consoleSystem import info, warn
+
+# Fast functions (function that use the profiler class to be used elsewere)
+def toggle_profiler(context=None): return profiler.toggle(context)
+
+class profilerHandler:
+
+    def __init__(self, output_folder:str = ""):
+        # Setting up the profiler
+        options = param_get("profiler")
+        self.output_folder = output_folder # The folder of logs.log
+        self.mode = options["mode"]
+        self.interval = options["interval"] # Time in ms of cpu between two samples
+        self.running = False
+        self.context = None      # Function giving a label of the current state (scene and map), saved with each sample
+        self.samples = {}        # (label, stack of code objects) -> count
+        self.profile = None
+        self.previous_handler = None
+        self.metadata = {}
+        info("Profiler handler initialized.")
+
+    def quit(self):
+        if self.running:
+            self.stop()
+        info("Profiler handler has quit.")
+
+    def toggle(self, context=None):
+        """Start a session, or stop the running one"""
+        if self.running:
+            return self.stop()
+        return self.start(context)
+
+    def start(self, context=None):
+        """
+        Start a profiling session on the main thread.
+
+        Args:
+            context: function returning a label of the current state (like "scene/map"), saved with the samples.
+
+        Returns:
+            True if the session started. False otherwise.
+        """
+        if self.running:
+            return False
+        self.context = context
+        self.samples = {}
+        mode = self.mode
+        if mode == "sampling" and not hasattr(signal, "setitimer"):
+            warn("No profiling timer on this system. Fallback to cProfile.")
+            mode = "cprofile"
+        self.metadata = {"mode": mode, "interval_ms": self.interval, "start": time.time(),
+                         "start_context": context() if context else None}
+
+        if mode == "sampling":
+            self.previous_handler = signal.signal(signal.SIGPROF, self.sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval / 1000, self.interval / 1000)
+        else:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        self.running = True
+        info("Profiler started ("+mode+").")
+        return True
+
+    def sample(self, signum, frame):
+        """Count the stack of the interrupted frame (signal handler, it runs on the main thread)"""
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        key = (self.context() if self.context else "", tuple(codes))
+        self.samples[key] = self.samples.get(key, 0) + 1
+
+    def stop(self):
+        """
+        Stop the session and write its files: profile-<date>.collapsed, .pstats and .json.
+
+        Returns:
+            The path of the files without extension. None if no session was running.
+        """
+        if not self.running:
+            return None
+        self.running = False
+        if self.metadata["mode"] == "sampling":
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, self.previous_handler or signal.SIG_DFL)
+        else:
+            self.profile.disable()
+        self.metadata["stop"] = time.time()
+        self.metadata["stop_context"] = self.context() if self.context else None
+
+        path = os.path.join(self.output_folder, "profile-"+time.strftime("%Y%m%d-%H%M%S", time.localtime(self.metadata["start"])))
+        if self.metadata["mode"] == "sampling":
+            if len(self.samples) != 0:
+                self.write_collapsed(path+".collapsed")
+                with open(path+".pstats", "wb") as file:
+                    marshal.dump(self.get_stats(), file)
+            else:
+                warn("No sample taken (the main thread was idle), only the metadata is written.")
+            contexts = {}
+            for (label, stack), count in self.samples.items():
+                contexts[label] = contexts.get(label, 0) + count
+            self.metadata["samples"] = sum(contexts.values())
+            self.metadata["contexts"] = contexts
+        else:
+            self.profile.dump_stats(path+".pstats")
+            self.profile = None
+        with open(path+".json", "w") as file:
+            json.dump(self.metadata, file, indent=4)
+        info("Profiler stopped, files written in '"+path+".*'.")
+        return path
+
+    def get_name(self, code):
+        """Get the name of a function in a collapsed stack"""
+        return os.path.basename(code.co_filename)+":"+code.co_name+":"+str(code.co_firstlineno)
+
+    def write_collapsed(self, path:str):
+        """Write the samples as collapsed stacks: one "context;root;...;leaf count" line per stack"""
+        lines = {}
+        for (label, stack), count in self.samples.items():
+            line = ";".join([label or "main"] + [self.get_name(code) for code in reversed(stack)])
+            lines[line] = lines.get(line, 0) + count
+        with open(path, "w") as file:
+            file.writelines(line+" "+str(count)+"\n" for line, count in lines.items())
+
+    def get_stats(self):
+        """
+        Turn the samples into pstats data: {function: (calls, calls, own time, total time, callers)}, in seconds.
+        A call is a sample where the function is on the stack.
+        """
+        stats = {}
+        interval = self.interval / 1000
+        for (label, stack), count in self.samples.items():
+            functions = [(code.co_filename, code.co_firstlineno, code.co_name) for code in stack]
+            seen = set()
+            for k, function in enumerate(functions):
+                calls, _, own, total, callers = stats.get(function, (0, 0, 0, 0, {}))
+                if k == 0:
+                    own += count * interval
+                if function not in seen:
+                    seen.add(function)
+                    calls += count
+                    total += count * interval
+                if k + 1 < len(functions):
+                    callers[functions[k + 1]] = callers.get(functions[k + 1], 0) + count
+                stats[function] = (calls, calls, own, total, callers)
+        return stats
+
+# Set the profiler object
+profiler = profilerHandler()
\ No newline at end of file
@@ -1,9 +1,302 @@
 # This file handle the loads of the scenes and the maps.
 import pygame, pytmx, pyscroll
 import os
-from utils.storageHandler import param_get
+import copyreg
+import xml.etree.ElementTree as ElementTree
+from collections import namedtuple
+from itertools import islice
+from heapq import heappop, heappush
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, wait
+from utils.storageHandler import storage, param_get, file_read
+from utils.timeToolbox import animation_clock, Chrono
+from utils.navigationHandler import build_nav_grid
+from utils.mapStreamer import index_map, streamedMapData
 from utils.consoleSystem import warn, info, debug, trace
 
+# An object of a map read without pytmx (same attributes names as a pytmx object)
+mapObject = namedtuple("mapObject", "id name type x y width height properties")
+
+# Yielded by a load before a step that can't be split, so a time sliced load starts it on a fresh slice
+FRESH_SLICE = object()
+
+def set_element_state(element, state):
+    """Restore a pytmx element sent by a worker process (its __getattr__ reads properties, which isn't set yet)"""
+    element.__dict__.update(state)
+
+def reduce_element(element):
+    """Pickle a pytmx element by its attributes (and its items for the object groups, which are lists)"""
+    return copyreg.__newobj__, (type(element),), element.__dict__, iter(element) if isinstance(element, list) else None, None, set_element_state
+
+# The parsed maps are sent back by the worker processes
+def register_elements(cls):
+    copyreg.pickle(cls, reduce_element)
+    for subclass in cls.__subclasses__():
+        register_elements(subclass)
+register_elements(pytmx.TiledElement)
+
+def deferred_image_loader(filename, colorkey, **kwargs):
+    """Pytmx image loader that only decodes the tiles, they are converted later on the main thread"""
+    if colorkey:
+        colorkey = pygame.Color("#{0}".format(colorkey))
+    pixelalpha = kwargs.get("pixelalpha", True)
+    image = pygame.image.load(filename)
+
+    def load_image(rect=None, flags=None):
+        tile = image.subsurface(rect).copy() if rect else image.copy()
+        if flags:
+            tile = pytmx.util_pygame.handle_transformation(tile, flags)
+        return (tile, colorkey, pixelalpha)
+
+    return load_image
+
+def parse_map(path):
+    """
+    Parse a map and decode its tiles (run on a worker process), return the tmx data and the time it took (ms).
+    The surfaces can't be pickled, so the tiles are sent as (RGBA bytes, size, colorkey, pixelalpha).
+    """
+    chrono = Chrono("ms")
+    tmx_data = pytmx.TiledMap(path, image_loader=deferred_image_loader)
+    tmx_data.images = [image and (pygame.image.tobytes(image[0], "RGBA"), image[0].get_size(), image[1], image[2]) for image in tmx_data.images]
+    return tmx_data, chrono.elapsed_time()
+
+def read_color(value):
+    """Read a tiled colour ('#aarrggbb' or '#rrggbb') as a (r, g, b) tuple"""
+    value = value.lstrip("#")
+    if len(value) == 8:
+        value = value[2:]
+    return (int(value[0:2], 16), int(value[2:4], 16), int(value[4:6], 16))
+
+def read_properties(element):
+    """Read the <properties> of a tmx element as a dict, with the values converted to their type"""
+    properties = {}
+    node = element.find("properties")
+    if node is None:
+        return properties
+    for prop in node.findall("property"):
+        value = prop.get("value", prop.text)
+        match prop.get("type", "string"):
+            case "int" | "object":
+                value = int(value)
+            case "float":
+                value = float(value)
+            case "bool":
+                value = value == "true"
+        properties[prop.get("name")] = value
+    return properties
+
+def read_map_metadata(path):
+    """Read the size, the properties and the object layers of a map, without the tile layers and tilesets images"""
+    metadata = {"properties": {}, "object_layers": {}, "objects": []}
+    tileset_depth = 0 # The object groups inside a tileset are the collision shapes of its tiles, not objects of the map
+    for event, element in ElementTree.iterparse(path, events=("start", "end")):
+        if event == "start":
+            if element.tag == "map":
+                metadata.update({key: int(element.get(key)) for key in ("width", "height", "tilewidth", "tileheight")})
+            elif element.tag == "tileset":
+                tileset_depth += 1
+            continue
+        match element.tag:
+            case "layer" | "data":
+                # The tiles are never needed here, free them as soon as they are parsed
+                element.clear()
+            case "tileset":
+                tileset_depth -= 1
+                element.clear()
+            case "objectgroup" if tileset_depth != 0:
+                continue
+            case "objectgroup":
+                metadata["object_layers"][element.get("name")] = read_properties(element)
+                for obj in element.findall("object"):
+                    metadata["objects"].append(mapObject(
+                        int(obj.get("id")), obj.get("name"), obj.get("type", obj.get("class")),
+                        float(obj.get("x", 0)), float(obj.get("y", 0)),
+                        float(obj.get("width", 0)), float(obj.get("height", 0)), read_properties(obj)))
+                element.clear()
+            case "map":
+                metadata["properties"] = read_properties(element)
+    return metadata
+
+def read_map_header(path):
+    """Read the size and the properties of a map, the parse stops before the tilesets and the layers"""
+    header = {"properties": {}}
+    depth = 0
+    for event, element in ElementTree.iterparse(path, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if element.tag == "map":
+                header.update({key: int(element.get(key)) for key in ("width", "height", "tilewidth", "tileheight")})
+                root = element
+            elif depth == 2 and element.tag != "properties":
+                break
+            continue
+        depth -= 1
+        if depth == 1 and element.tag == "properties":
+            header["properties"] = read_properties(root)
+            break
+    return header
+
+def index_streamed_map(path):
+    """Index a streamed map and read its metadata (run on a worker process), return the index, the metadata and the modification time"""
+    modification_time = os.path.getmtime(path)
+    return index_map(path), read_map_metadata(path), modification_time
+
+class mapRenderer(pyscroll.orthographic.BufferedRenderer):
+    """
+    Buffered renderer that counts the tiles drawn on its buffer.
+    With deferred, the first draw of the buffer is left to draw_pending, so it can be spread over many frames.
+    """
+
+    def __init__(self, *args, deferred:bool = False, **kwargs):
+        self.tile_redraws = 0
+        self.deferred = deferred
+        self.pending = None # Tiles left to draw on the buffer (deferred first draw)
+        super().__init__(*args, **kwargs)
+        self.deferred = False
+
+    def redraw_tiles(self, surface):
+        self.pending = None
+        if not self.deferred:
+            return super().redraw_tiles(surface)
+        self._clear_surface(self._buffer)
+        self.pending = self.data.get_tile_images_by_rect(self._tile_view)
+
+    def draw_pending(self, count:int):
+        """
+        Draw some tiles of the deferred first draw.
+
+        Returns:
+            True if there are tiles left to draw. False otherwise.
+        """
+        if self.pending is None:
+            return False
+        self._tile_queue = list(islice(self.pending, count))
+        self._flush_tile_queue(self._buffer)
+        if len(self._tile_queue) < count:
+            self.pending = None
+        return self.pending is not None
+
+    def _flush_tile_queue(self, surface):
+        self._tile_queue = list(self._tile_queue)
+        self.tile_redraws += len(self._tile_queue)
+        super()._flush_tile_queue(surface)
+
+class animatedMapData(pyscroll.TiledMapData):
+    """Tiled map data where the animated tiles are grouped by animation and advanced by the shared animation clock"""
+
+    def _update_time(self):
+        self._last_time = animation_clock.elapsed_time()
+
+    def reload_animations(self):
+        super().reload_animations()
+
+        # Find every animated cell once, and index them by animation and by row
+        self._animation_rows = {}
+        for token in self._animation_map.values():
+            self._animation_rows[token] = {}
+        for l in self.tmx.visible_tile_layers:
+            for y, row in enumerate(self.tmx.layers[l].data):
+                for x, gid in enumerate(row):
+                    if gid in self._animation_map:
+                        token = self._animation_map[gid]
+                        token.positions.add((x, y, l))
+                        self._animation_rows[token].setdefault(y, []).append((x, l))
+
+    def get_tile_image(self, x, y, l):
+        try:
+            token = self._animation_map.get(self.tmx.layers[l].data[y][x])
+        except IndexError:
+            return None
+        if token is not None:
+            return token.frames[token.index].image
+        return self._get_tile_image(x, y, l)
+
+    def get_tile_images_by_rect(self, rect):
+        for x, y, l, tile in super().get_tile_images_by_rect(rect):
+            token = self._animation_map.get(self.tmx.layers[l].data[y][x])
+            if token is not None:
+                tile = token.frames[token.index].image
+            yield x, y, l, tile
+
+    def process_animation_queue(self, tile_view):
+        new_tiles = []
+        self._update_time()
+        if len(self._animation_queue) == 0 or self._animation_queue[0].next > self._last_time:
+            return new_tiles
+
+        tile_layers = tuple(self.visible_tile_layers)
+        while self._animation_queue[0].next <= self._last_time:
+            token = heappop(self._animation_queue)
+            token.advance(self._last_time)
+            heappush(self._animation_queue, token)
+
+            # Only redraw the cells of this animation that are on the buffer (the whole column of tiles)
+            rows = self._animation_rows[token]
+            for y in range(tile_view.top, tile_view.bottom):
+                for x, l in rows.get(y, ()):
+                    if tile_view.left <= x < tile_view.right:
+                        for layer in tile_layers:
+                            image = self.get_tile_image(x, y, layer)
+                            if image:
+                                new_tiles.append((x, y, layer, image))
+        return new_tiles
+
+class sceneLoader:
+    """Load of a scene that can be resumed, advanced by slices of time so no frame waits for the whole scene"""
+
+    def __init__(self, steps):
+        self.steps = steps   # Generator of the load (sceneHandler.load_steps)
+        self.done = False
+        self.result = None   # True if the scene is loaded, once it's done
+        self.current = 0     # Progress of the load (0 to 1)
+
+    def advance(self, budget:float = None):
+        """
+        Run the load for a time budget in ms (to the end without budget).
+        With a budget, it stops early when the load waits for a worker, the next call checks it again.
+        A step that can't be split is never started after another one, it gets the whole next slice.
+
+        Returns:
+            True if the load is done. False otherwise.
+        """
+        deadline = None if budget is None else perf_counter() + budget / 1000
+        started = False
+        while not self.done:
+            try:
+                step = next(self.steps)
+            except StopIteration as end:
+                self.done, self.result, self.current = True, end.value, 1
+                break
+            if step is FRESH_SLICE:
+                if deadline is not None and started:
+                    break
+                continue
+            started = True
+            if isinstance(step, Future):
+                if deadline is not None:
+                    break
+                wait([step])
+            else:
+                self.current = step
+            if deadline is not None and perf_counter() >= deadline:
+                break
+        return self.done
+
+    def finish(self):
+        """Run the load to the end and get its result"""
+        self.advance()
+        return self.result
+
+    def progress(self):
+        """Get the progress of the load (0 to 1)"""
+        return self.current
+
+    def cancel(self):
+        """Abort the load (nothing is added in the scenes)"""
+        self.steps.close()
+        self.done = True
+        self.result = False
+
 class sceneHandler:
 
     def __init__(self):
@@ -12,10 +305,28 @@ class sceneHandler:
         self.data = {}
         self.selected_map = None
         self.selected_scene = None
+        self.stats = {"loads": 0, "unloads": 0}
+        self.metadata = {} # Metadata of the map files: path -> (modification time, metadata)
+        self.index = None  # Portals and exits of the registered scenes: (modification time of scenes.json, modification time of each map, index)
+        # The maps of a scene are parsed and decoded concurrently by worker processes (the parse holds the GIL)
+        self.load_workers = param_get("load_workers")
+        self.parse_pool = ProcessPoolExecutor(max_workers=max(1, self.load_workers or 1))
+        # The chunks of the streamed maps are read by this pool
+        self.load_pool = ThreadPoolExecutor(max_workers=max(1, self.load_workers or 1), thread_name_prefix="map_loader")
+        # The maps are drawn on the internal resolution canvas if there is one
+        self.canvas_size = param_get("internal_resolution") or param_get("screen_size")
+        # The big maps are streamed by chunks around the camera
+        self.streaming = param_get("streaming")
+        # The scenes being loaded step by step: scene name -> sceneLoader
+        self.loaders = {}
 
         info("Scene handler initialized.")
 
     def quit(self):
+        for loader in list(self.loaders.values()):
+            loader.cancel()
+        self.parse_pool.shutdown(cancel_futures=True)
+        self.load_pool.shutdown(cancel_futures=True)
         info("Scene handler has quit.")
 
     ##########
@@ -24,54 +335,217 @@ class sceneHandler:
 
     def load_scene(self, scene_name=None):
         """Add the maps from the scene in the dictionnary"""
-        
-        # Get all maps in scene
         if scene_name is None:
             scene_name = self.selected_scene
-        scene = param_get(scene_name, "scenes")
+        return self.start_loading(scene_name).finish()
 
-        if scene == None:
-            warn("Scene '"+scene_name+"' not found.")
-            return False
-        self.data[scene_name] = {}
-        for map_name in scene:
-            # Load all the maps in scene
-            self.data[scene_name][map_name] = {"file": scene[map_name]}
-            try:
-                self.data[scene_name][map_name]["tmx_data"] = pytmx.util_pygame.load_pygame(self.scene_folder_path + self.data[scene_name][map_name]["file"])
-            except FileNotFoundError:
-                warn("Map named '"+self.data[scene_name][map_name]["file"]+"' not found. Abort load.")
+    def start_loading(self, scene_name=None):
+        """Get the loader of a scene (sceneLoader), it's created if the scene isn't already being loaded"""
+        if scene_name is None:
+            scene_name = self.selected_scene
+        if scene_name not in self.loaders:
+            self.loaders[scene_name] = sceneLoader(self.load_steps(scene_name))
+        return self.loaders[scene_name]
+
+    def load_steps(self, scene_name):
+        """
+        Load a scene step by step (the generator run by a sceneLoader).
+        It yields the progress (0 to 1) after each step, or the future of a worker when it waits for it.
+        The maps are added in the dictionnary only when they are all loaded.
+
+        Returns:
+            True if the scene is loaded. False otherwise.
+        """
+        parsing = {}
+        streamed = {}
+        try:
+            # Get all maps in scene
+            scene = param_get(scene_name, "scenes")
+            if scene == None:
+                warn("Scene '"+scene_name+"' not found.")
                 return False
-            self.data[scene_name][map_name]["map_data"] = pyscroll.TiledMapData(self.data[scene_name][map_name]["tmx_data"])
-
-            # Get the walls and portals
-            self.data[scene_name][map_name]["walls"] = []
-            self.data[scene_name][map_name]["portals"] = {}
-            self.data[scene_name][map_name]["portals_exits"] = {}
-            for obj in self.data[scene_name][map_name]["tmx_data"].objects:
-                match obj.type:
-                    case "collision":
-                        self.data[scene_name][map_name]["walls"].append({
-                            "rect": pygame.Rect(obj.x, obj.y, obj.width, obj.height),
-                            "collision_type": obj.properties["collision_type"]})
-                    case "portal":
-                        self.data[scene_name][map_name]["portals"][obj.name] = {
-                            "rect":pygame.Rect(obj.x, obj.y, obj.width, obj.height),
-                            "targeted_scene_name": obj.properties["targeted_scene_name"],
-                            "targeted_map_name": obj.properties["targeted_map_name"],
-                            "targeted_exit_name": obj.properties["targeted_exit_name"]}
-                    case "portal_exit":
-                        self.data[scene_name][map_name]["portals_exits"][obj.name] = self.data[scene_name][map_name]["tmx_data"].get_object_by_name(obj.name)
-
-            # Get the map_layer and set the zoom
-            self.data[scene_name][map_name]["map_layer"] = pyscroll.orthographic.BufferedRenderer(self.get_map_data(map_name, scene_name), param_get("screen_size"))
-            screen_size = param_get("screen_size")
-            if screen_size[0] < screen_size[1]:
-                self.data[scene_name][map_name]["map_layer"].zoom = screen_size[1]*self.data[scene_name][map_name]["tmx_data"].get_layer_by_name("objects").properties["zoom"]/self.get_tmx_data(map_name, scene_name).height/self.get_tmx_data(map_name, scene_name).tileheight
-            else:
-                self.data[scene_name][map_name]["map_layer"].zoom = screen_size[0]*self.data[scene_name][map_name]["tmx_data"].get_layer_by_name("objects").properties["zoom"]/self.get_tmx_data(map_name, scene_name).width/self.get_tmx_data(map_name, scene_name).tilewidth
-            
-        trace("'"+scene_name+"' loaded!")
+            self.stats["loads"] += 1
+            chrono = Chrono("ms")
+            parsing_time = 0
+            steps = len(scene) * 6 # Parsing, conversion, map data, navigation grid, renderer and its first draw of each map
+            maps = {}
+
+            # Parse and decode all the maps of the scene at the same time (the big maps are only indexed, they are streamed)
+            for map_name in scene:
+                if self.is_streamed(scene[map_name]):
+                    streamed[map_name] = self.parse_pool.submit(index_streamed_map, self.scene_folder_path + scene[map_name])
+                else:
+                    parsing[map_name] = self.parse_pool.submit(parse_map, self.scene_folder_path + scene[map_name])
+
+            for number, map_name in enumerate(scene):
+                # Load all the maps in scene (the surfaces are converted here, so the loader is run by the renderer)
+                data = maps[map_name] = {"file": scene[map_name]}
+                if map_name in streamed:
+                    while not streamed[map_name].done():
+                        yield streamed[map_name]
+                    try:
+                        index, metadata, modification_time = streamed[map_name].result()
+                        self.metadata[self.scene_folder_path + scene[map_name]] = (modification_time, metadata)
+                        yield from self.load_streamed_map(data, index)
+                        yield (number + 1) * 6 / steps
+                        continue
+                    except ValueError as reason:
+                        warn("Map named '"+scene[map_name]+"' can't be streamed ("+str(reason)+"). Loaded entirely.")
+                        parsing[map_name] = self.parse_pool.submit(parse_map, self.scene_folder_path + scene[map_name])
+                while not parsing[map_name].done():
+                    yield parsing[map_name]
+                try:
+                    tmx_data, map_parsing_time = parsing[map_name].result()
+                except FileNotFoundError:
+                    warn("Map named '"+data["file"]+"' not found. Abort load.")
+                    return False
+                parsing_time += map_parsing_time
+                yield (number * 6 + 1) / steps
+
+                # Convert the tiles one by one, so the slice can end between two of them
+                images = tmx_data.images
+                for k in range(len(images)):
+                    if images[k]:
+                        pixels, size, colorkey, pixelalpha = images[k]
+                        images[k] = pytmx.util_pygame.smart_convert(pygame.image.frombytes(pixels, size, "RGBA"), colorkey, pixelalpha)
+                        yield (number * 6 + 1 + k / len(images)) / steps
+                yield FRESH_SLICE
+                data["tmx_data"] = tmx_data
+                data["map_data"] = animatedMapData(tmx_data)
+
+                # Get the walls, portals and lights
+                data.update(self.read_objects(tmx_data.objects))
+                yield (number * 6 + 3) / steps
+
+                # Rasterize the walls in a navigation grid (one cell per tile)
+                yield FRESH_SLICE
+                data["nav_grid"] = build_nav_grid(data["walls"], tmx_data.width*tmx_data.tilewidth, tmx_data.height*tmx_data.tileheight, tmx_data.tilewidth)
+                yield (number * 6 + 4) / steps
+
+                # Get the map_layer with its zoom (given to the constructor, so the buffer is only drawn once)
+                yield FRESH_SLICE
+                renderer = mapRenderer(data["map_data"], self.canvas_size, deferred=True, zoom=self.get_fitting_zoom(
+                    tmx_data.get_layer_by_name("objects").properties["zoom"], tmx_data.width*tmx_data.tilewidth, tmx_data.height*tmx_data.tileheight))
+                yield (number * 6 + 5) / steps
+
+                # Draw its buffer by slices of tiles
+                while renderer.draw_pending(128):
+                    yield (number * 6 + 5) / steps
+                data["map_layer"] = renderer
+                yield (number + 1) * 6 / steps
+
+            self.data[scene_name] = maps
+            elapsed_time = chrono.elapsed_time()
+            trace("'"+scene_name+"' loaded!")
+            debug("'"+scene_name+"' loaded in "+str(elapsed_time)+"ms ("+str(len(scene))+" maps, "+str(parsing_time)+"ms of parsing in the workers).")
+            return True
+        finally:
+            # Also run when the load is aborted
+            for future in list(parsing.values()) + list(streamed.values()):
+                future.cancel()
+            self.loaders.pop(scene_name, None)
+
+    def read_objects(self, objects):
+        """Sort the objects of a map: {"walls", "portals", "portals_exits", "lights"}"""
+        content = {"walls": [], "portals": {}, "portals_exits": {}, "lights": []}
+        for obj in objects:
+            match obj.type:
+                case "collision":
+                    content["walls"].append({
+                        "rect": pygame.Rect(obj.x, obj.y, obj.width, obj.height),
+                        "collision_type": obj.properties["collision_type"]})
+                case "portal":
+                    content["portals"][obj.name] = {
+                        "rect":pygame.Rect(obj.x, obj.y, obj.width, obj.height),
+                        "targeted_scene_name": obj.properties["targeted_scene_name"],
+                        "targeted_map_name": obj.properties["targeted_map_name"],
+                        "targeted_exit_name": obj.properties["targeted_exit_name"]}
+                case "portal_exit":
+                    content["portals_exits"][obj.name] = obj
+                case "light":
+                    content["lights"].append({
+                        "position": (obj.x + obj.width/2, obj.y + obj.height/2),
+                        "radius": obj.properties.get("radius", max(obj.width, obj.height, 32)),
+                        "color": read_color(obj.properties.get("color", "#ffffffff"))})
+        return content
+
+    def get_fitting_zoom(self, zoom, width, height):
+        """Get the zoom of a map renderer, from the zoom property of the map and its size in pixels"""
+        if self.canvas_size[0] < self.canvas_size[1]:
+            return self.canvas_size[1]*zoom/height
+        return self.canvas_size[0]*zoom/width
+
+    def is_streamed(self, file):
+        """
+        Check if a map is streamed by chunks: asked by its "streamed" property or bigger than the streaming threshold.
+        Only the header of the map is read, so it's cheap even for the big maps.
+        """
+        try:
+            header = read_map_header(self.scene_folder_path + file)
+        except OSError:
+            warn("Map named '"+file+"' not found.")
+            return False
+        if "streamed" in header["properties"]:
+            return header["properties"]["streamed"]
+        return header["width"]*header["height"] >= self.streaming["min_tiles"]
+
+    def load_streamed_map(self, data, index):
+        """
+        Set up a streamed map (its dict in the scene): its chunked map data and the objects of each chunk, no tile is read here.
+        It's run by load_steps, it yields FRESH_SLICE before its two long steps (the tilesets and the renderer).
+        """
+        map_file = data["file"]
+        yield FRESH_SLICE
+        metadata = self.get_map_metadata(map_file)
+        map_data = streamedMapData(self.scene_folder_path + map_file, index, self.load_pool,
+                                   self.streaming["chunk_size"], self.streaming["load_radius"], self.streaming["evict_radius"])
+        content = self.read_objects(metadata["objects"])
+
+        # The walls and portals are added with their chunks, the exits and the lights are always known
+        chunks = {}
+        for wall in content["walls"]:
+            for key in map_data.get_chunks(wall["rect"]):
+                chunks.setdefault(key, {"walls": [], "portals": {}})["walls"].append(wall)
+        for name, portal in content["portals"].items():
+            for key in map_data.get_chunks(portal["rect"]):
+                chunks.setdefault(key, {"walls": [], "portals": {}})["portals"][name] = portal
+        data.update({
+            "tmx_data": None,
+            "map_data": map_data,
+            "chunks": chunks,
+            "walls": [],
+            "portals": {},
+            "portals_exits": content["portals_exits"],
+            "lights": content["lights"],
+            "nav_grid": None})
+
+        yield FRESH_SLICE
+        data["map_layer"] = mapRenderer(map_data, self.canvas_size, zoom=self.get_fitting_zoom(
+            metadata["object_layers"]["objects"]["zoom"], index["width"]*index["tilewidth"], index["height"]*index["tileheight"]))
+        debug("'"+map_file+"' streamed by chunks of "+str(self.streaming["chunk_size"])+" tiles ("+str(index["width"])+"x"+str(index["height"])+" tiles).")
+
+    def stream_map(self, position, map_name=None, scene_name=None):
+        """Load the chunks of a streamed map around a position and update its walls and portals. Return True if they changed"""
+        if scene_name is None:
+            scene_name = self.selected_scene
+        if map_name is None:
+            map_name = self.selected_map
+        data = self.data[scene_name][map_name]
+        if not isinstance(data["map_data"], streamedMapData):
+            return False
+        added, removed = data["map_data"].stream(position)
+        if len(added) + len(removed) == 0:
+            return False
+
+        # Rebuild the lists, so a reader never sees them half updated
+        walls = {}
+        portals = {}
+        for key in data["map_data"].chunks:
+            if key in data["chunks"]:
+                walls.update((id(wall), wall) for wall in data["chunks"][key]["walls"])
+                portals.update(data["chunks"][key]["portals"])
+        data["walls"] = list(walls.values())
+        data["portals"] = portals
         return True
 
     def unload_scene(self, scene_name=None):
@@ -82,7 +556,11 @@ class sceneHandler:
             scene_name = self.selected_scene
 
         if scene_name in self.data:
+            for map_name in self.data[scene_name]:
+                if isinstance(self.data[scene_name][map_name].get("map_data"), streamedMapData):
+                    self.data[scene_name][map_name]["map_data"].close()
             del self.data[scene_name]
+            self.stats["unloads"] += 1
             trace("'"+scene_name+"' unloaded!")
             return True
         else:
@@ -192,6 +670,28 @@ class sceneHandler:
             map_name = self.selected_map
         return self.data[scene_name][map_name]["walls"]
     
+    def get_lights(self, map_name=None, scene_name=None):
+        """Get the static lights of the map (list)"""
+        if scene_name is None:
+            scene_name = self.selected_scene
+        if self.has_scene_load(scene_name) == 0:
+            trace("Scene '"+scene_name+"' not loaded.")
+            self.load_scene(scene_name)
+        if map_name is None:
+            map_name = self.selected_map
+        return self.data[scene_name][map_name]["lights"]
+
+    def get_nav_grid(self, map_name=None, scene_name=None):
+        """Get the navigation grid of the map (navGrid, None for the streamed maps)"""
+        if scene_name is None:
+            scene_name = self.selected_scene
+        if self.has_scene_load(scene_name) == 0:
+            trace("Scene '"+scene_name+"' not loaded.")
+            self.load_scene(scene_name)
+        if map_name is None:
+            map_name = self.selected_map
+        return self.data[scene_name][map_name]["nav_grid"]
+
     def get_portals(self, map_name=None, scene_name=None):
         """Get the player position of the map (list)"""
         if scene_name is None:
@@ -204,11 +704,92 @@ class sceneHandler:
         return self.data[scene_name][map_name]["portals"]
     
     def get_portal_exit(self, portals):
-        """Get the portal_exit of a portal"""
+        """Get the portal_exit of a portal (from the metadata if the targeted scene is not loaded)"""
         if self.has_scene_load(portals["targeted_scene_name"]) == 0:
-            trace("Scene '"+portals["targeted_scene_name"]+"' not loaded.")
-            self.load_scene(portals["targeted_scene_name"])
+            trace("Scene '"+portals["targeted_scene_name"]+"' not loaded, exit read from the metadata.")
+            return self.get_index()[portals["targeted_scene_name"]][portals["targeted_map_name"]]["portals_exits"][portals["targeted_exit_name"]]
         return self.data[portals["targeted_scene_name"]][portals["targeted_map_name"]]["portals_exits"][portals["targeted_exit_name"]]
 
+    ############
+    # METADATA #
+    ############
+
+    def get_map_metadata(self, file):
+        """Get the metadata of a map file (dict), read again only if the file changed. None if the file doesn't exist"""
+        path = self.scene_folder_path + file
+        try:
+            modification_time = os.path.getmtime(path)
+        except OSError:
+            warn("Map named '"+file+"' not found.")
+            return None
+        if path not in self.metadata or self.metadata[path][0] != modification_time:
+            self.metadata[path] = (modification_time, read_map_metadata(path))
+        return self.metadata[path][1]
+
+    def get_index(self):
+        """
+        Get the portals and exits of all the registered scenes without loading them: {scene: {map: {"portals", "portals_exits"}}}
+        It's read again only if scenes.json or one of the map files changed.
+        """
+        file = storage.get_address_of("scenes")
+        if file is None:
+            return {}
+        modification_time = os.path.getmtime(storage.storage_folder_path + file)
+        if self.index is None or self.index[0] != modification_time or any(
+                self.get_modification_time(path) != map_time for path, map_time in self.index[1].items()):
+            map_times = {}
+            index = self.read_index(map_times)
+            self.index = (modification_time, map_times, index)
+        return self.index[2]
+
+    def get_modification_time(self, path):
+        """Get the modification time of a file, None if it doesn't exist"""
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def read_index(self, map_times:dict):
+        """Read the portals and exits of all the registered scenes from the metadata of their maps (map_times gets the modification time of each map)"""
+        index = {}
+        scenes = file_read("scenes")
+        if scenes is None:
+            return index
+        for scene_name in scenes:
+            index[scene_name] = {}
+            for map_name in scenes[scene_name]:
+                path = self.scene_folder_path + scenes[scene_name][map_name]
+                map_times[path] = self.get_modification_time(path)
+                metadata = self.get_map_metadata(scenes[scene_name][map_name])
+                if metadata is None:
+                    continue
+                index[scene_name][map_name] = {"portals": {}, "portals_exits": {}}
+                for obj in metadata["objects"]:
+                    match obj.type:
+                        case "portal":
+                            index[scene_name][map_name]["portals"][obj.name] = {
+                                "rect": pygame.Rect(obj.x, obj.y, obj.width, obj.height),
+                                "targeted_scene_name": obj.properties["targeted_scene_name"],
+                                "targeted_map_name": obj.properties["targeted_map_name"],
+                                "targeted_exit_name": obj.properties["targeted_exit_name"]}
+                        case "portal_exit":
+                            index[scene_name][map_name]["portals_exits"][obj.name] = obj
+        return index
+
+    def validate_portals(self):
+        """Check that every portal of every registered scene points to a real exit. Return True if they all do"""
+        valid = True
+        index = self.get_index()
+        for scene_name in index:
+            for map_name in index[scene_name]:
+                for portal_name, portal in index[scene_name][map_name]["portals"].items():
+                    target = index.get(portal["targeted_scene_name"], {}).get(portal["targeted_map_name"])
+                    if target is None or portal["targeted_exit_name"] not in target["portals_exits"]:
+                        warn("Portal '"+portal_name+"' of '"+scene_name+"/"+map_name+"' points to a missing exit '"+portal["targeted_scene_name"]+"/"+portal["targeted_map_name"]+"/"+portal["targeted_exit_name"]+"'.")
+                        valid = False
+        if valid:
+            debug("All the portals point to real exits.")
+        return valid
+
 # Set the console object
 scene = sceneHandler()
\ No newline at end of file
@@ -4,8 +4,9 @@
 #  - shortset: manipulate shortcuts creation, renaming, destuction, etc.
 #  - addressof: get the adress of a file by passing its shortcut, name(with extension) or the default file.
 #
-#  - file_read: read a file (json, txt) and return its content.
-#  - file_create: create a new file (json, txt) and return True if the operation has been done.
+#  - file_read: read a file (json, jsonl, txt) and return its content.
+#  - file_write: write a content in a file (json, jsonl, txt) and return True if the operation has been done.
+#  - file_create: create a new file (json, jsonl, txt) and return True if the operation has been done.
 #  - file_delete: delete a file (json, txt) and return True if the operation has been done.
 #  - file_rename: rename a file (json, txt) and return True if the operation has been done.
 #
@@ -14,40 +15,103 @@
 #  - param_set: set multiple parameters in a json file and return True if the operation has been done.
 #  - param_del: delete multiple parameters in a json file and return True if the operation has been done.
 #  - param_reset: reset/patternate a json file and return True if the operation has been done.
+#
+# The jsonl files are line-delimited documents (one ["key", value] per line). Only the keys are read when the file is opened,
+# each value is decoded the first time it's asked, so a lookup doesn't pay for the whole file.
+import copy
 import json
 import os
+from collections.abc import MutableMapping
+from time import perf_counter
 from utils.consoleSystem import error, warn, trace, info
 
 # Fast functions (function that use the storage class to be used elsewere)
 def file_read(file_name:str=None, type=None): return storage.file_read(file_name, type)
+def file_write(file_name:str, content): return storage.file_write(file_name, content)
 def file_create(file_name:str, type=None, content=None, short:str=None): return storage.file_create(file_name, type, content, short)
 def file_delete(file_name:str, type=None): return storage.file_delete(file_name, type)
 def file_rename(file_name:str, new_name:str, type=None): return storage.file_rename(file_name, new_name, type)
 def param_get(param_name:str, file_name:str=None): return storage.parameter_get(param_name, file_name)
-def param_getlist(param_name:list, file_name=None):
-    """Get  a list of parameters"""
-    if type(param_name) != list:
-        warn("param_getlist take param_name as a list. Type "+type(param_name)+" not allowed")
-        yield None
-    if type(file_name) == str:
-        file_name = [file_name]*len(param_name)
-    elif file_name == None:
-        file_name = [None]*len(param_name)
-    elif type(file_name) != list:
-        warn("param_getlist take file_name as a list or str. Type "+type(param_name)+" not allowed")
-        yield None
-    for k in range(len(param_name)):
-        yield storage.parameter_get(param_name[k], file_name[k])
+def param_getlist(param_name:list, file_name=None): return storage.parameter_getlist(param_name, file_name)
 def param_set(param_name:str, param_value:str, file_name:str=None): return storage.parameter_set(param_name, param_value, file_name)
 def param_del(param_name:str, file_name:str=None): return storage.parameter_delete(param_name, file_name)
 def param_reset(file_name:str=None, reset:dict={}): return storage.parameter_reset(file_name, reset)
     
 
+class lazyDocument(MutableMapping):
+    """A jsonl document where the values are decoded only when they are asked"""
+
+    def __init__(self, path:str):
+        self.path = path
+        self.index = {}  # key -> (offset, length) of its line in the file
+        self.values = {} # decoded (or modified) values
+        self.shared = {} # values decoded from the file, shared with the copies and never modified
+        decoder = json.JSONDecoder()
+        with open(path, "rb") as file:
+            offset = 0
+            for line in file:
+                if line.strip():
+                    # Only the key at the start of the line is decoded
+                    key = decoder.raw_decode(line.decode("utf-8"), line.index(b"[") + 1)[0]
+                    self.index[key] = (offset, len(line))
+                offset += len(line)
+
+    def __getitem__(self, key):
+        if key not in self.values:
+            if key not in self.shared:
+                offset, length = self.index[key]
+                with open(self.path, "rb") as file:
+                    file.seek(offset)
+                    self.shared[key] = json.loads(file.read(length))[1]
+            self.values[key] = copy.deepcopy(self.shared[key])
+        return self.values[key]
+
+    def __setitem__(self, key, value):
+        self.values[key] = value
+        self.index.setdefault(key, None)
+
+    def __delitem__(self, key):
+        del self.index[key]
+        self.values.pop(key, None)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def copy(self):
+        """Get a copy of the document that can be modified without changing this one (the decoded values are shared)"""
+        document = lazyDocument.__new__(lazyDocument)
+        document.path = self.path
+        document.index = dict(self.index)
+        document.values = copy.deepcopy(self.values)
+        document.shared = self.shared
+        return document
+
+    def lines(self):
+        """Get the lines of the document, the values never decoded are copied from the file as they are"""
+        lines = []
+        with open(self.path, "rb") as file:
+            for key, place in self.index.items():
+                if key in self.values or place is None:
+                    lines.append(json.dumps([key, self.values[key]]).encode("utf-8") + b"\n")
+                else:
+                    file.seek(place[0])
+                    lines.append(file.read(place[1]).rstrip(b"\n") + b"\n")
+        return lines
+
 class storageHandler():
 
-    def __init__(self):
+    def __init__(self, storage_folder_path:str = "assets/storage/"):
         # Setting up the storage handler
-        self.storage_folder_path = "assets/storage/"
+        self.storage_folder_path = storage_folder_path
+        self.stats = {"reads": 0, "writes": 0}
+        self.documents = {}   # Opened jsonl documents: path -> (modification time, document)
+        self.parse_times = {} # Time of the last parse of each file in ms
         try:
             self.shortcuts = self.file_read("shortcuts.json")
         except:
@@ -163,10 +227,17 @@ class storageHandler():
         if type is None:
             file_name, temp = file_name.split(".", 1)
             type = "."+temp
+        self.stats["reads"] += 1
         try:
+            if type == ".jsonl":
+                # A copy, so the opened document only changes when the file is written
+                return self.document_read(self.storage_folder_path+file_name+type).copy()
             with open(self.storage_folder_path+file_name+type) as file:
                 if type == ".json":
-                    return json.load(file)
+                    start = perf_counter()
+                    content = json.load(file)
+                    self.parse_times[file_name+type] = (perf_counter() - start) * 1000
+                    return content
                 elif type == ".txt":
                     return file.read()
                 else:
@@ -176,6 +247,81 @@ class storageHandler():
             warn("No files named '"+str(file_name+type)+"' were found.")
             return None
             
+    def document_read(self, path:str):
+        """
+        Open a jsonl document, or reuse it if the file didn't change since it was opened.
+
+        Args:
+            path (str): path of the file.
+
+        Returns:
+            The document (lazyDocument).
+        """
+        modification_time = os.path.getmtime(path)
+        if path not in self.documents or self.documents[path][0] != modification_time:
+            start = perf_counter()
+            self.documents[path] = (modification_time, lazyDocument(path))
+            self.parse_times[os.path.basename(path)] = (perf_counter() - start) * 1000
+            trace("'"+path+"' indexed in "+format(self.parse_times[os.path.basename(path)], ".3f")+"ms.")
+        return self.documents[path][1]
+
+    def file_write(self, file_name:str, content):
+        """
+        Write a content in a file, in the format of its extension.
+
+        Args:
+            file_name (str): name of the file (with extension).
+            content: content of the file.
+
+        Returns:
+            True if the file has been written. False otherwise.
+        """
+        path = self.storage_folder_path + file_name
+        type = "." + file_name.split(".", 1)[-1]
+        self.stats["writes"] += 1
+        match type:
+            case ".json":
+                with open(path, "w") as file:
+                    json.dump(dict(content), file, indent=4)
+            case ".jsonl":
+                if isinstance(content, lazyDocument):
+                    lines = content.lines()
+                else:
+                    lines = [json.dumps([key, value]).encode("utf-8") + b"\n" for key, value in content.items()]
+                with open(path, "wb") as file:
+                    file.writelines(lines)
+                self.documents.pop(path, None)
+            case ".txt":
+                with open(path, "w") as file:
+                    file.write(content)
+            case _:
+                warn("Unknown file extension '"+type+"'.")
+                return False
+        return True
+
+    def file_convert(self, file_name:str, type:str):
+        """
+        Convert a json file to jsonl (or the inverse) and point its shortcut to the new file.
+
+        Args:
+            file_name (str): name or shortcut of the file.
+            type (str): new extension (".json" or ".jsonl").
+
+        Returns:
+            True if the file has been converted. False otherwise.
+        """
+        old_name = self.get_address_of(file_name)
+        if old_name is None:
+            return False
+        content = self.file_read(old_name)
+        new_name = old_name.split(".", 1)[0] + type
+        if content is None or not self.file_write(new_name, dict(content)):
+            return False
+        short = [key for key in self.shortcuts if self.shortcuts[key] == old_name]
+        os.remove(self.storage_folder_path + old_name)
+        self.set_shortcut(new_name, old_name, short[0] if len(short) != 0 else None)
+        return True
+
     def file_create(self, file_name:str, type=None, content=None, short:str=None):
         """
         Create a new file.
@@ -194,6 +340,7 @@ class storageHandler():
             type = "."+temp
         if os.path.exists(self.storage_folder_path+file_name+type):
             self.file_delete(file_name, type)
+        self.stats["writes"] += 1
         with open(self.storage_folder_path+file_name+type, "a") as file:
             if type == ".json":
                 if content != None:
@@ -202,6 +349,11 @@ class storageHandler():
                     file.write("{\n\n}")
                 self.set_shortcut(file_name+type, None, short)
                 return True
+            elif type == ".jsonl":
+                file.close()
+                self.file_write(file_name+type, content if content != None else {})
+                self.set_shortcut(file_name+type, None, short)
+                return True
             elif type == ".txt":
                 if content != None:
                     file.write(content)
@@ -293,6 +445,27 @@ class storageHandler():
             warn("Can't find parameter named '"+str(param_name)+"' in the file '"+str(file_name)+"'.")
             return None
         
+    def parameter_getlist(self, param_name:list, file_name=None):
+        """
+        Get multiple parameters (yield their values).
+
+        Args:
+            param_name (list): names of the parameters.
+            file_name (list or str): names of the files.
+        """
+        if type(param_name) != list:
+            warn("param_getlist take param_name as a list. Type "+type(param_name)+" not allowed")
+            yield None
+        if type(file_name) == str:
+            file_name = [file_name]*len(param_name)
+        elif file_name == None:
+            file_name = [None]*len(param_name)
+        elif type(file_name) != list:
+            warn("param_getlist take file_name as a list or str. Type "+type(param_name)+" not allowed")
+            yield None
+        for k in range(len(param_name)):
+            yield self.parameter_get(param_name[k], file_name[k])
+
     def parameter_set(self, param_name, param_value, file_name=None):
         """
         Set multiple parameters in a file.
@@ -318,7 +491,7 @@ class storageHandler():
             try:
                 modified = self.file_read(file_name[k])
                 modified[param_name[k]] = param_value[k]
-                json.dump(modified, open(self.storage_folder_path+file_name[k], "w"), indent=4)
+                self.file_write(file_name[k], modified)
                 return True
             except:
                 warn("Can't set the parameter named '"+str(param_name[k])+"' in the file '"+str(file_name[k])+"'.")
@@ -345,7 +518,7 @@ class storageHandler():
             try:
                 modified = self.file_read(file_name[k])
                 del modified[param_name[k]]
-                json.dump(modified, open(self.storage_folder_path+file_name[k], "w"), indent=4)
+                self.file_write(file_name[k], modified)
                 return True
             except:
                 warn("Can't delete the parameter named '"+str(param_name[k])+"' in the file '"+str(file_name[k])+"'.")
@@ -364,8 +537,7 @@ class storageHandler():
         file_name = self.get_address_of(file_name)
         
         try:
-            json.dump(reset, open(self.storage_folder_path+file_name, "w"), indent=4)
-            return True
+            return self.file_write(file_name, reset)
         except:
             warn("Can't reset the file '"+str(file_name)+"'")
             return False
@@ -0,0 +1,118 @@
+# This handler publishes the state of the game in a shared memory segment, for the monitoring tools.
+#
+# FUNCTION:
+#  - start: create the segment.
+#  - publish: write the record of the frame (does nothing if the segment isn't created).
+#  - read_record: read a record from a segment (used by the readers).
+#
+# The record has a fixed layout and is written without lock: the sequence number is odd while the record is written
+# and even when it's complete. A reader copies the record and keeps it only if the sequence didn't change in between.
+import struct
+import time
+from multiprocessing import shared_memory, resource_tracker
+from utils.consoleSystem import console, info, warn
+
+# Fast functions (function that use the telemetry class to be used elsewere)
+def publish(tick:int, frame_ms:float, fps:float, phases:dict, position, scene_name:str, map_name:str):
+    return telemetry.publish(tick, frame_ms, fps, phases, position, scene_name, map_name)
+
+# Layout of the segment: a header, the sequence number, then the record
+MAGIC = b"MLDT"
+VERSION = 1
+HEADER = struct.Struct("<4sII")  # magic, version, size of the record
+SEQUENCE = struct.Struct("<Q")
+SEQUENCE_OFFSET = 16
+RECORD_OFFSET = 24
+PHASES = ("update", "map", "camera", "draw", "light", "upscale", "flip")
+RECORD = struct.Struct("<Qddd7fdd3I32s32s")
+FIELDS = ("tick", "time", "frame_ms", "fps") + PHASES + ("x", "y", "fatal", "error", "warn", "scene_name", "map_name")
+SIZE = RECORD_OFFSET + RECORD.size
+
+def read_record(buffer, retries:int = 100):
+    """
+    Read a complete record from a segment buffer.
+
+    Returns:
+        The record (dict) with its sequence number. None if the segment isn't a telemetry segment or is always being written.
+    """
+    magic, version, size = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or version != VERSION or size != RECORD.size:
+        return None
+    for k in range(retries):
+        before = SEQUENCE.unpack_from(buffer, SEQUENCE_OFFSET)[0]
+        if before % 2 == 1:
+            continue
+        values = RECORD.unpack_from(buffer, RECORD_OFFSET)
+        if SEQUENCE.unpack_from(buffer, SEQUENCE_OFFSET)[0] == before:
+            record = dict(zip(FIELDS, values))
+            record["scene_name"] = record["scene_name"].rstrip(b"\0").decode("utf-8", "replace")
+            record["map_name"] = record["map_name"].rstrip(b"\0").decode("utf-8", "replace")
+            record["sequence"] = before
+            return record
+    return None
+
+def attach(name:str):
+    """Open an existing segment to read it (the reader doesn't own it, so it's not destroyed when the reader quits)"""
+    segment = shared_memory.SharedMemory(name=name)
+    try:
+        resource_tracker.unregister(segment._name, "shared_memory")
+    except Exception:
+        pass
+    return segment
+
+class telemetryHandler:
+
+    def __init__(self):
+        # Setting up the telemetry
+        self.segment = None
+        self.sequence = 0
+        info("Telemetry handler initialized.")
+
+    def quit(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment.unlink()
+            self.segment = None
+        info("Telemetry handler has quit.")
+
+    def start(self, name:str):
+        """
+        Create the shared memory segment.
+
+        Returns:
+            True if the segment has been created. False otherwise.
+        """
+        try:
+            self.segment = shared_memory.SharedMemory(name=name, create=True, size=SIZE)
+        except FileExistsError:
+            # Left by a game that didn't quit, it's replaced
+            warn("Telemetry segment '"+name+"' already exists. It's replaced.")
+            old = shared_memory.SharedMemory(name=name)
+            old.close()
+            old.unlink()
+            self.segment = shared_memory.SharedMemory(name=name, create=True, size=SIZE)
+        except OSError as reason:
+            warn("Can't create the telemetry segment '"+name+"' ("+str(reason)+").")
+            return False
+        HEADER.pack_into(self.segment.buf, 0, MAGIC, VERSION, RECORD.size)
+        SEQUENCE.pack_into(self.segment.buf, SEQUENCE_OFFSET, 0)
+        self.sequence = 0
+        info("Telemetry published in the shared memory '"+name+"'.")
+        return True
+
+    def publish(self, tick:int, frame_ms:float, fps:float, phases:dict, position, scene_name:str, map_name:str):
+        """Write the record of the frame"""
+        if self.segment is None:
+            return
+        buffer = self.segment.buf
+        self.sequence += 1
+        SEQUENCE.pack_into(buffer, SEQUENCE_OFFSET, self.sequence)
+        RECORD.pack_into(buffer, RECORD_OFFSET, tick, time.time(), frame_ms, fps,
+                         *[phases.get(phase, 0) for phase in PHASES], position[0], position[1],
+                         console.counts["fatal"], console.counts["error"], console.counts["warn"],
+                         str(scene_name).encode("utf-8")[:32], str(map_name).encode("utf-8")[:32])
+        self.sequence += 1
+        SEQUENCE.pack_into(buffer, SEQUENCE_OFFSET, self.sequence)
+
+# Set the telemetry object
+telemetry = telemetryHandler()
\ No newline at end of file
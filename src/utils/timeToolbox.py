@@ -1,7 +1,9 @@
 # Time handler
 # It's a tool box that gives functions to manage time, chronometer, timer and clock.
 from datetime import datetime
-from time import sleep
+from time import sleep, perf_counter
+from array import array
+from operator import mul, sub
 
 class Date:
 
@@ -79,31 +81,172 @@ class Clock:
         self.update()
         return int(self.updated_date.timestamp() * 1000000 - self.start_time)
 
+    def get_time(self, unit:str = "ms"):
+        """
+        Get the clock in the given unit ("s", "ms" or "unix"). None if the unit is unknown.
+        """
+        match unit:
+            case "s":
+                return self.get_sec()
+            case "ms":
+                return self.get_msec()
+            case "unix":
+                return self.get_misc()
+            case _:
+                return None
+
+    def get_counter(self):
+        """
+        Get a high resolution counter in seconds (only differences are meaningful).
+        """
+        return perf_counter()
+
+    def sleep(self, time:float):
+        """
+        Wait for the given time in seconds.
+        """
+        if time > 0:
+            sleep(time)
+
+class VirtualClock(Clock):
+
+    def __init__(self, speed:float = 0, start_time:int = None, start_time_type:str = "ms"):
+        """
+        A clock that only moves when it's advanced (speed 0) or that runs at speed times the real time.
+        """
+        self.virtual_time = datetime.now().timestamp()
+        self.anchor = perf_counter()
+        self.speed = speed
+        super().__init__(start_time, start_time_type)
+
+    def update(self):
+        """
+        Update the clock.
+        """
+        self.updated_date = datetime.fromtimestamp(self.get_counter())
+
+    def get_counter(self):
+        """
+        Get the virtual time in seconds.
+        """
+        if self.speed:
+            return self.virtual_time + (perf_counter() - self.anchor) * self.speed
+        return self.virtual_time
+
+    def set_speed(self, speed:float = 0):
+        """
+        Set the speed of the clock (0 means it only moves when advanced).
+        """
+        self.virtual_time = self.get_counter()
+        self.anchor = perf_counter()
+        self.speed = speed
+
+    def advance(self, time:float, unit:str = "ms"):
+        """
+        Move the clock forward.
+        """
+        match unit:
+            case "s":
+                self.virtual_time += time
+            case "ms":
+                self.virtual_time += time / 1000
+            case "unix":
+                self.virtual_time += time / 1000000
+            case _:
+                return False
+        return True
+
+    def sleep(self, time:float):
+        """
+        Wait for the given time in seconds of virtual time.
+        """
+        if time <= 0:
+            return
+        if self.speed:
+            sleep(time / self.speed)
+        else:
+            self.advance(time, "s")
+
 # Creating the date and clock objects
 date = Date()
-clock = Clock(0)
+# The active clock can be swapped, so it's read with get_clock() (an imported reference keeps the clock it was given)
+active_clock = Clock(0)
+clock = active_clock
+
+def get_clock():
+    """
+    Get the active time source.
+    """
+    return active_clock
+
+def set_clock(new_clock:Clock = None, keep_time:bool = True):
+    """
+    Set the active time source used by the chronometers, timers, frame pacers and delay (None gives back the real clock).
+    With keep_time, the new clock starts at the time of the replaced one, so the running chronometers and timers go on.
+    """
+    global active_clock, clock
+    if new_clock is None:
+        new_clock = Clock(0)
+    if keep_time and new_clock is not active_clock:
+        new_clock.update()
+        new_clock.start_time = int(new_clock.updated_date.timestamp() * 1000000) - active_clock.get_misc()
+    active_clock = clock = new_clock
+    return active_clock
+
+def get_statistics(values, percentiles:tuple = (50, 90, 99)):
+    """
+    Get the count, min, max, mean, standard deviation and percentiles of integer values (times).
+    The passes run in C on the array, but each value is still read as a Python int, and the percentiles sort one copy of the values.
+    """
+    count = len(values)
+    if count == 0:
+        return {"count": 0}
+
+    # Integer sums are exact, so the variance doesn't lose precision on big values
+    total = sum(values)
+    squares = sum(map(mul, values, values))
+    statistics = {
+        "count": count,
+        "min": min(values),
+        "max": max(values),
+        "mean": total / count,
+        "stddev": max(count * squares - total * total, 0) ** 0.5 / count}
+
+    # Percentiles with a linear interpolation between the closest ranks
+    ordered = sorted(values)
+    for percentile in percentiles:
+        rank = (count - 1) * percentile / 100
+        low = int(rank)
+        high = min(low + 1, count - 1)
+        statistics["p"+str(percentile)] = ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+    return statistics
 
 class Chrono:
 
-    def __init__(self, unit:str = "ms"):
-        # Setting up the chronometer
+    def __init__(self, unit:str = "ms", capacity:int = None, time_source:Clock = None):
+        # Setting up the chronometer (a capacity turns the snapshots into a ring buffer)
+        if capacity is not None and capacity < 1:
+            raise ValueError("The capacity of a chronometer must be at least 1 (got "+str(capacity)+").")
+        self.time_source = time_source
+        self.capacity = capacity
         self.reset(unit)
         self.running = True
 
+    def get_clock(self):
+        """
+        Get the time source (the active clock if none was given).
+        """
+        return get_clock() if self.time_source is None else self.time_source
+
     def update(self):
         """
         Update the chronometer if it is running.
         """
         if self.running:
-            match self.unit:
-                case "s":
-                    self.updated_time = clock.get_sec()
-                case "ms":
-                    self.updated_time = clock.get_msec()
-                case "unix":
-                    self.updated_time = clock.get_misc()
-                case _:
-                    return False
+            time = self.get_clock().get_time(self.unit)
+            if time is None:
+                return False
+            self.updated_time = time
 
 
     def elapsed_time(self):
@@ -134,18 +277,12 @@ class Chrono:
         Set or reset the chronometer unit, time and snapshot.
         """
         self.unit = unit
-        match unit:
-                case "s":
-                    self.start_time = clock.get_sec()
-                case "ms":
-                    self.start_time = clock.get_msec()
-                case "unix":
-                    self.start_time = clock.get_misc()
-                case _:
-                    return False
+        self.start_time = self.get_clock().get_time(unit)
+        if self.start_time is None:
+            return False
         self.updated_time = self.start_time
         self.removed = 0
-        self.snapshot = []
+        self.del_snapshot("all")
 
     def isrunning(self):
         """
@@ -157,46 +294,115 @@ class Chrono:
         """
         Save a chronometer snapshot.
         """
-        self.snapshot.append(self.elapsed_time())
+        if self.capacity is None:
+            self.snapshot.append(self.elapsed_time())
+        else:
+            self.snapshot[self.snapshot_count % self.capacity] = self.elapsed_time()
+        self.snapshot_count += 1
     
     def get_snapshot(self, index:int = -1):
         """
-        Get a chronometer snapshot.
+        Get a chronometer snapshot ("all" gives an array of the kept snapshots, oldest first).
         """
         if index == "all":
-            return self.snapshot
-        return self.snapshot[index]
+            if self.capacity is None or self.snapshot_count <= self.capacity:
+                return self.snapshot[:self.snapshot_count]
+            split = self.snapshot_count % self.capacity
+            return self.snapshot[split:] + self.snapshot[:split]
+        if self.capacity is None:
+            return self.snapshot[index]
+        # The ring is read in place: the oldest kept snapshot is at the write position once it's full
+        kept = min(self.snapshot_count, self.capacity)
+        if index < 0:
+            index += kept
+        if not 0 <= index < kept:
+            raise IndexError("snapshot index out of range")
+        oldest = self.snapshot_count % self.capacity if self.snapshot_count > self.capacity else 0
+        return self.snapshot[(oldest + index) % self.capacity]
     
     def del_snapshot(self, index:int = -1):
         """
         Delete a chronometer snapshot.
         """
         if index == "all":
-            self.snapshot = []
-        else:
+            if self.capacity is None:
+                self.snapshot = array("q")
+            else:
+                self.snapshot = array("q", bytes(8 * self.capacity))
+            self.snapshot_count = 0
+        elif self.capacity is None:
             del self.snapshot[index]
+            self.snapshot_count -= 1
+        else:
+            kept = self.get_snapshot("all")
+            del kept[index]
+            self.del_snapshot("all")
+            self.snapshot[:len(kept)] = kept
+            self.snapshot_count = len(kept)
+
+    def get_laps(self):
+        """
+        Get the time between each kept snapshot (array). The first lap starts at 0 if no snapshot was overwritten.
+        """
+        snapshots = self.get_snapshot("all")
+        laps = array("q", map(sub, snapshots[1:], snapshots[:-1]))
+        if len(snapshots) != 0 and len(snapshots) == self.snapshot_count:
+            laps.insert(0, snapshots[0])
+        return laps
+
+    def get_statistics(self, percentiles:tuple = (50, 90, 99), laps:bool = True):
+        """
+        Get the count, min, max, mean, standard deviation and percentiles of the laps (or of the raw snapshots).
+        """
+        return get_statistics(self.get_laps() if laps else self.get_snapshot("all"), percentiles)
+
+    def export_snapshot(self, path:str, type:str = "csv"):
+        """
+        Export the snapshots in a csv file (index, snapshot, lap) or in a binary file (native int64).
+        """
+        snapshots = self.get_snapshot("all")
+        match type:
+            case "csv":
+                laps = self.get_laps()
+                offset = len(snapshots) - len(laps)
+                with open(path, "w") as file:
+                    file.write("index,snapshot_"+self.unit+",lap_"+self.unit+"\n")
+                    for k in range(len(snapshots)):
+                        lap = "" if k < offset else str(laps[k - offset])
+                        file.write(str(k)+","+str(snapshots[k])+","+lap+"\n")
+            case "bin":
+                with open(path, "wb") as file:
+                    snapshots.tofile(file)
+            case _:
+                return False
+        return True
+
+# The shared clock of all the tile and sprite animations
+animation_clock = Chrono("ms")
 
 class Timer:
 
-    def __init__(self, time:int, unit:str = "ms"):
+    def __init__(self, time:int, unit:str = "ms", time_source:Clock = None):
         # Setting up the timer
+        self.time_source = time_source
         self.reset(time, unit)
         self.running = True
 
+    def get_clock(self):
+        """
+        Get the time source (the active clock if none was given).
+        """
+        return get_clock() if self.time_source is None else self.time_source
+
     def update(self):
         """
         Update the timer if it is running.
         """
         if self.running:
-            match self.unit:
-                case "s":
-                    self.updated_time = clock.get_sec()
-                case "ms":
-                    self.updated_time = clock.get_msec()
-                case "unix":
-                    self.updated_time = clock.get_misc()
-                case _:
-                    return False
+            time = self.get_clock().get_time(self.unit)
+            if time is None:
+                return False
+            self.updated_time = time
 
     def remaining_time(self):
         """
@@ -239,15 +445,9 @@ class Timer:
         Set or reset the timer unit and time.
         """
         self.unit = unit
-        match unit:
-                case "s":
-                    self.start_time = clock.get_sec()
-                case "ms":
-                    self.start_time = clock.get_msec()
-                case "unix":
-                    self.start_time = clock.get_misc()
-                case _:
-                    return False
+        self.start_time = self.get_clock().get_time(unit)
+        if self.start_time is None:
+            return False
         self.updated_time = self.start_time
         self.remaining = time
         self.removed = 0
@@ -258,14 +458,109 @@ class Timer:
         """
         return self.running
     
-def delay(time:int, unit:str = "ms"):
+def delay(time:int, unit:str = "ms", time_source:Clock = None):
     """
-    Delay the program for a given time.
+    Delay the program for a given time (a virtual clock is advanced instead of sleeping).
     """
+    if time_source is None:
+        time_source = get_clock()
     match unit:
         case "s":
-            sleep(time)
+            time_source.sleep(time)
         case "ms":
-            sleep(time/1000)
+            time_source.sleep(time/1000)
         case "unix":
-            sleep(time/1000000)
\ No newline at end of file
+            time_source.sleep(time/1000000)
+
+class FramePacer:
+
+    def __init__(self, fps:int = 60, mode:str = "hybrid", idle_fps:int = 5, spin_margin:float = 2, time_source:Clock = None):
+        # Setting up the frame pacer
+        self.time_source = time_source
+        self.spin_margin = spin_margin / 1000
+        self.set_fps(fps, idle_fps)
+        self.set_mode(mode)
+        self.last_source = self.get_clock()
+        self.last_tick = self.last_source.get_counter()
+        self.frame_time = 0
+        self.frame_times = []
+
+    def set_fps(self, fps:int = 60, idle_fps:int = 5):
+        """
+        Set the frame cap and the idle frame cap (0 or None means uncapped).
+        """
+        self.fps = fps
+        self.idle_fps = idle_fps
+        self.frame_period = 1 / fps if fps else 0
+        self.idle_period = 1 / idle_fps if idle_fps else self.frame_period
+
+    def set_mode(self, mode:str = "hybrid"):
+        """
+        Set the pacing mode: "cap" (sleep), "busy" (spin), "hybrid" (sleep then spin) or "uncapped".
+        """
+        if mode not in ("cap", "busy", "hybrid", "uncapped"):
+            return False
+        self.mode = mode
+        return True
+
+    def get_clock(self):
+        """
+        Get the time source (the active clock if none was given).
+        """
+        return get_clock() if self.time_source is None else self.time_source
+
+    def wait(self, deadline:float, mode:str):
+        """
+        Wait until the deadline (time source counter in seconds) using the given pacing mode.
+        """
+        time_source = self.get_clock()
+        # A virtual clock can't be spun on, it only moves when slept on
+        if isinstance(time_source, VirtualClock):
+            mode = "cap"
+        match mode:
+            case "cap":
+                time_source.sleep(deadline - time_source.get_counter())
+            case "busy":
+                while time_source.get_counter() < deadline:
+                    pass
+            case "hybrid":
+                time_source.sleep(deadline - time_source.get_counter() - self.spin_margin)
+                while time_source.get_counter() < deadline:
+                    pass
+
+    def tick(self, idle:bool = False):
+        """
+        Wait for the end of the frame and return the frame time in ms.
+        When idle, the idle frame cap is used with a plain sleep so the CPU can rest.
+        """
+        # The counters of two time sources can't be compared
+        if self.get_clock() is not self.last_source:
+            self.last_source = self.get_clock()
+            self.last_tick = self.last_source.get_counter()
+
+        if idle:
+            self.wait(self.last_tick + self.idle_period, "cap")
+        elif self.mode != "uncapped" and self.frame_period:
+            self.wait(self.last_tick + self.frame_period, self.mode)
+
+        now = self.get_clock().get_counter()
+        self.frame_time = (now - self.last_tick) * 1000
+        self.last_tick = now
+        self.frame_times.append(self.frame_time)
+        if len(self.frame_times) > 10:
+            del self.frame_times[0]
+        return self.frame_time
+
+    def get_frame_time(self):
+        """
+        Get the last frame time in ms.
+        """
+        return self.frame_time
+
+    def get_fps(self):
+        """
+        Get the frame rate averaged over the last ten frames.
+        """
+        if len(self.frame_times) == 0 or sum(self.frame_times) == 0:
+            return 0
+        return 1000 * len(self.frame_times) / sum(self.frame_times)
\ No newline at end of file